@@ -0,0 +1,66 @@
+"""
+Compares the registered PDF backends on a local corpus of PDFs.
+
+Usage (from the project root):
+    python -m benchmarks.pdf_backends path/to/pdfs [--backends pymupdf pdfplumber] [--doc-type citation]
+
+For every backend it reports pages per second and the number of chunks the
+extracted text is split into, so the speed/quality trade-off is visible.
+Timings include the PDF_FALLBACK_BACKEND pass for pages a backend left empty.
+"""
+import argparse
+import time
+from pathlib import Path
+from typing import List
+
+import pymupdf
+
+from main import get_chunk_splitter
+from models.classificationModel import DocumentType
+from utils.textExtraction import PDF_BACKENDS, _parse_pdf_pages
+
+
+def benchmark(pdf_paths: List[Path], backends: List[str], doc_type: DocumentType) -> None:
+    splitter, _ = get_chunk_splitter(doc_type)
+    print(f"{'backend':<12} {'files':>6} {'pages':>7} {'seconds':>9} {'pages/s':>9} {'chars':>10} {'chunks':>7}")
+    for backend in backends:
+        total_pages = total_chars = total_chunks = 0
+        elapsed = 0.0
+        for path in pdf_paths:
+            file_bytes = path.read_bytes()
+            with pymupdf.open(stream=file_bytes, filetype="pdf") as doc:
+                page_numbers = list(range(doc.page_count))
+            started = time.perf_counter()
+            # Parse in-process and bypass the page cache, so the numbers measure
+            # the engine rather than the process pool or earlier runs.
+            texts, page_count = _parse_pdf_pages(file_bytes, page_numbers, backend)
+            text = "".join(texts)
+            elapsed += time.perf_counter() - started
+            total_pages += page_count
+            total_chars += len(text)
+            total_chunks += len(splitter.split_text(text))
+        pages_per_second = total_pages / elapsed if elapsed else 0.0
+        print(
+            f"{backend:<12} {len(pdf_paths):>6} {total_pages:>7} {elapsed:>9.2f} "
+            f"{pages_per_second:>9.1f} {total_chars:>10} {total_chunks:>7}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", type=Path, help="A PDF file or a directory searched recursively for PDFs.")
+    parser.add_argument("--backends", nargs="+", default=list(PDF_BACKENDS), choices=list(PDF_BACKENDS))
+    parser.add_argument(
+        "--doc-type", type=DocumentType, default=DocumentType.CITATION,
+        help="Document type whose token budget is used to count chunks.",
+    )
+    args = parser.parse_args()
+
+    pdf_paths = [args.corpus] if args.corpus.is_file() else sorted(args.corpus.rglob("*.pdf"))
+    if not pdf_paths:
+        parser.error(f"No PDFs found in {args.corpus}")
+    benchmark(pdf_paths, args.backends, args.doc_type)
+
+
+if __name__ == "__main__":
+    main()
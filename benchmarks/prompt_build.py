@@ -0,0 +1,61 @@
+"""
+Measures the per-chunk cost of building the stateful extraction prompt.
+
+Usage (from the project root):
+    python -m benchmarks.prompt_build [--iterations 2000]
+
+"before" re-renders the schema JSON and runs one str.replace per variable on
+every call, as PromptManager used to. "after" uses the precompiled template and
+the cached schema. CitationFile is used because its schema carries the large
+CountryEnum and LicenseEnum definitions.
+"""
+import argparse
+import json
+import timeit
+
+from main import prompt_manager
+from models.citationModel import CitationFile
+from models.classificationModel import DocumentType
+
+CHUNK = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 50
+VARIABLES = {
+    "document_content": CHUNK,
+    "document_type": DocumentType.CITATION.value,
+    "extracted_keys": "authors, cff_version, title",
+    "missing_keys": "abstract, doi, keywords, license, references, version",
+}
+
+
+def build_prompt_before() -> str:
+    template = prompt_manager.prompts["extraction_stateful"]
+    all_vars = {
+        "pydantic_schema_json": json.dumps(CitationFile.model_json_schema(), indent=2),
+        "schema_specific_rules": prompt_manager.prompts.get(DocumentType.CITATION.value, ""),
+        **VARIABLES,
+    }
+    for key, value in all_vars.items():
+        template = template.replace(f"{{{{{key}}}}}", str(value))
+    return template
+
+
+def build_prompt_after() -> str:
+    return prompt_manager.get_prepared_prompt(
+        "extraction_stateful", CitationFile, variables=VARIABLES, doc_type=DocumentType.CITATION
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    assert build_prompt_before() == build_prompt_after(), "Both builders must produce the same prompt."
+    before = timeit.timeit(build_prompt_before, number=args.iterations) / args.iterations
+    after = timeit.timeit(build_prompt_after, number=args.iterations) / args.iterations
+    print(f"before: {before * 1e6:10.1f} us/prompt")
+    print(f"after:  {after * 1e6:10.1f} us/prompt")
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,27 @@
 import os
+import re
 import json
+import time
+import uuid
 import asyncio
+import logging
+import hashlib
+import shutil
+import zipfile
+import tempfile
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Type, Dict, Any, Literal, Set, Optional, Union
+from typing import (
+    Type, Dict, Any, AsyncIterator, Awaitable, Callable, FrozenSet, Iterable, List, Literal, Set, Optional, Tuple, Union
+)
 
 from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel, ValidationError
 from dotenv import load_dotenv
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.text_splitter import TextSplitter
 
 # --- Local Module Imports ---
 # (Assuming these models are defined as in your original code)
@@ -17,30 +31,190 @@ from models.citationModel import CitationFile
 from models.githubActionModel import GitHubAction, RunsJavascript, RunsComposite, RunsDocker
 
 # Import the newly created async utility functions
-from utils.textExtraction import read_file_from_memory_async
-from utils.inference import run_inference_async
+from utils.textExtraction import MAX_PDF_BYTES, PDF_BACKEND, iter_text_from_file_async, shutdown_pdf_executor
+from utils.cache import ChunkResultStore, DocumentResultCache
+from utils.chunking import iter_chunks_async, iter_content_defined_chunks_async, ChunkPlanner
+from utils.schema import prune_json_schema, collection_fields, scalar_fields, sub_schema
+from utils.correction import ROOT, JsonPath, format_errors, get_at, group_errors, set_at
+from utils.localClassifier import classify_locally
+from utils.merge import MergeAccumulator
+from utils.repair import repair_document
+from utils.actionYaml import extract_action_yaml
+from utils.pipeline import END, ReplayableQueueReader, feed_queue_async, iter_queue_async
+from utils.jobs import JobStore, JobWorkerPool
+from utils.structuredLogger import RequestContextMiddleware, configure_logging, log_context, shutdown_logging
+from utils.metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    DOCUMENT_CHUNKS,
+    DOCUMENT_SECONDS,
+    DOCUMENTS,
+    STAGE_SECONDS,
+    record_cache_lookup,
+    render_metrics,
+)
+from utils.inference import (
+    TruncatedResponseError,
+    run_inference_async,
+    init_async_llm_client,
+    close_async_llm_client,
+    get_llm_pool_stats,
+    get_llm_cache_stats,
+    get_rate_limiter_stats,
+)
 
 load_dotenv()
+configure_logging()
+logger = logging.getLogger(__name__)
 
 # --- Application Setup ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Creates the shared LLM client and the result stores and starts the job
+    workers on startup; stops them and closes everything else on exit.
+    """
+    global job_store, job_workers, document_cache, chunk_store
+    init_async_llm_client()
+    if DOCUMENT_CACHE_ENABLED:
+        document_cache = DocumentResultCache(
+            DOCUMENT_CACHE_DB_PATH, max_bytes=DOCUMENT_CACHE_MAX_BYTES, ttl_seconds=DOCUMENT_CACHE_TTL
+        )
+    if CHUNK_STORE_ENABLED:
+        chunk_store = ChunkResultStore(CHUNK_STORE_DB_PATH, max_bytes=CHUNK_STORE_MAX_BYTES, ttl_seconds=CHUNK_STORE_TTL)
+    job_store = JobStore(JOBS_DB_PATH, lease_seconds=JOB_LEASE_SECONDS)
+    job_workers = JobWorkerPool(
+        job_store, _run_job_async, _error_status, workers=JOB_WORKERS, retention_seconds=JOB_RETENTION_SECONDS
+    )
+    job_workers.start()
+    yield
+    await job_workers.stop()
+    job_store.close()
+    if document_cache is not None:
+        document_cache.close()
+    if chunk_store is not None:
+        chunk_store.close()
+    await close_async_llm_client()
+    shutdown_pdf_executor()
+    shutdown_logging()
+
 app = FastAPI(
     title="Unstructured Text to JSON API v2",
-    description="An improved system to convert large unstructured documents into a structured JSON format using a map-and-merge strategy."
+    description="An improved system to convert large unstructured documents into a structured JSON format using a map-and-merge strategy.",
+    lifespan=lifespan,
 )
+app.add_middleware(RequestContextMiddleware)
 
 # --- Configuration & Constants ---
 MODEL_NAME = "llama-3.3-70b-versatile" #os.getenv("MODEL_NAME", "llama3-8b-8192") # Using a Groq model name
 PROMPT_DIR = "prompts"
-CHUNK_SIZE = 3000
-CHUNK_OVERLAP = 200
+# Rendered schemas kept by the PromptManager; each set of missing fields renders
+# its own pruned schema, and a large one (e.g. CitationFile) is ~50 KB.
+PROMPT_SCHEMA_CACHE_SIZE = 64
+CHUNK_SIZE = 3000 # Characters of the document start used for classification
+
+# Extraction chunks are sized in tokens: the model's context window minus the
+# rendered prompt for the schema and the tokens reserved for the response.
+MODEL_CONTEXT_TOKENS = int(os.getenv("MODEL_CONTEXT_TOKENS", "131072"))
+RESPONSE_TOKEN_RESERVE = int(os.getenv("RESPONSE_TOKEN_RESERVE", "8192"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "64"))
+MAX_CHUNK_TOKENS = int(os.getenv("MAX_CHUNK_TOKENS", "0")) # 0 means bounded by the context window only
+# The "incremental" mode only reuses chunks of an edited document if the document
+# spans many chunks, so its chunks are capped well below the context window.
+INCREMENTAL_CHUNK_TOKENS = int(os.getenv("INCREMENTAL_CHUNK_TOKENS", "2000"))
+# A chunk whose extraction is cut off at RESPONSE_TOKEN_RESERVE tokens is split
+# in two and retried, down to this many characters.
+MIN_SPLIT_CHUNK_CHARS = 1000
+UPLOAD_SPOOL_BLOCK_SIZE = 1024 * 1024
+# Bounds of the queues between the parsing, chunking and extraction stages.
+TEXT_QUEUE_SIZE = 32
+CHUNK_QUEUE_SIZE = 16
+
+# "sequential" feeds every chunk the keys found so far; "parallel" dispatches chunks
+# concurrently in waves, each wave seeing the keys found by the waves before it;
+# "incremental" extracts chunks statelessly and reuses the results of chunks seen before.
+ExtractionMode = Literal["sequential", "parallel", "incremental"]
+EXTRACTION_MODE: ExtractionMode = os.getenv("EXTRACTION_MODE", "sequential")
+MAX_CONCURRENT_CHUNKS = int(os.getenv("MAX_CONCURRENT_CHUNKS", "4"))
+CHUNK_WAVE_SIZE = int(os.getenv("CHUNK_WAVE_SIZE", "8"))
+
+# The classification LLM call is skipped when the local classifier is at least this confident.
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.8"))
+
+# Stop reading chunks once the schema is saturated (see StoppingPolicy).
+EARLY_STOP_ENABLED = os.getenv("EARLY_STOP_ENABLED", "true").lower() == "true"
+# The first chunk always adds fields, so with a patience of 1 extraction can stop
+# after two chunks, once the second added nothing.
+EARLY_STOP_PATIENCE = int(os.getenv("EARLY_STOP_PATIENCE", "1"))
+
+# Validation errors are corrected per failing sub-object, in parallel, unless they
+# touch the document root or more than this many sub-objects.
+MAX_TARGETED_CORRECTIONS = int(os.getenv("MAX_TARGETED_CORRECTIONS", "16"))
+
+# Whole-document results, keyed by the upload's content hash and the pipeline version.
+DOCUMENT_CACHE_ENABLED = os.getenv("DOCUMENT_CACHE_ENABLED", "true").lower() == "true"
+DOCUMENT_CACHE_DB_PATH = os.getenv("DOCUMENT_CACHE_DB_PATH", os.path.join(".cache", "documents.sqlite3"))
+DOCUMENT_CACHE_MAX_BYTES = int(os.getenv("DOCUMENT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+DOCUMENT_CACHE_TTL = float(os.getenv("DOCUMENT_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Stateless results of single chunks, reused by the "incremental" extraction mode.
+CHUNK_STORE_ENABLED = os.getenv("CHUNK_STORE_ENABLED", "true").lower() == "true"
+CHUNK_STORE_DB_PATH = os.getenv("CHUNK_STORE_DB_PATH", os.path.join(".cache", "chunks.sqlite3"))
+CHUNK_STORE_MAX_BYTES = int(os.getenv("CHUNK_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+CHUNK_STORE_TTL = float(os.getenv("CHUNK_STORE_TTL", str(30 * 24 * 3600)))
+
+# Background jobs: uploads are kept in JOBS_DIR until a worker has processed them.
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(".cache", "jobs"))
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(JOBS_DIR, "jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# A running job whose worker has not renewed its lease for this long is queued again.
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+# Finished jobs and their results are deleted after this long (0 = keep them).
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+# Batch uploads: documents processed at once per batch. Their LLM calls share the
+# global budget in utils.inference (LLM_MAX_CONCURRENT_REQUESTS, LLM_REQUESTS_PER_MINUTE).
+BATCH_MAX_CONCURRENT_DOCUMENTS = int(os.getenv("BATCH_MAX_CONCURRENT_DOCUMENTS", "8"))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "1000"))
+# Zip archives are checked against these before anything is extracted, and every
+# member is also cut off while it is copied, since the sizes in the archive may lie.
+BATCH_MAX_MEMBER_BYTES = int(os.getenv("BATCH_MAX_MEMBER_BYTES", str(MAX_PDF_BYTES)))
+BATCH_MAX_UNCOMPRESSED_BYTES = int(os.getenv("BATCH_MAX_UNCOMPRESSED_BYTES", str(1024 * 1024 * 1024)))
 
 # --- Helper Classes & Registries ---
 
+class CompiledTemplate:
+    """
+    A prompt template pre-split into literal text and {{placeholder}} segments.
+    Rendering joins the segments in one pass instead of rebuilding the whole
+    string once per variable. Placeholders without a value are kept verbatim.
+    """
+    PLACEHOLDER = re.compile(r"\{\{(\w+)\}\}")
+
+    def __init__(self, template: str):
+        parts = self.PLACEHOLDER.split(template)
+        self.literals: List[str] = parts[0::2]
+        self.names: List[str] = parts[1::2]
+
+    def render(self, values: Dict[str, Any]) -> str:
+        segments = [self.literals[0]]
+        for name, literal in zip(self.names, self.literals[1:]):
+            segments.append(str(values[name]) if name in values else f"{{{{{name}}}}}")
+            segments.append(literal)
+        return "".join(segments)
+
 class PromptManager:
     """Handles loading and preparing prompt templates."""
     def __init__(self, prompt_dir: str):
         self.prompt_dir = Path(prompt_dir)
         self.prompts = self._load_prompts()
+        self.prompt_hashes = {
+            name: hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+            for name, text in self.prompts.items()
+        }
+        self.compiled = {name: CompiledTemplate(text) for name, text in self.prompts.items()}
+        # Rendered schema JSON and rules per (model, doc_type, schema keys), least
+        # recently used first; bounded since the schema keys vary per chunk.
+        self._static_vars: "OrderedDict[tuple, Dict[str, str]]" = OrderedDict()
 
     def _load_prompts(self) -> Dict[str, str]:
         templates = {}
@@ -50,88 +224,400 @@ class PromptManager:
             templates[f.stem] = f.read_text(encoding="utf-8")
         return templates
 
+    def _get_static_vars(
+        self, model: Type[BaseModel], doc_type: Optional[DocumentType], schema_keys: Optional[FrozenSet[str]] = None
+    ) -> Dict[str, str]:
+        key = (model, doc_type, schema_keys)
+        static_vars = self._static_vars.get(key)
+        if static_vars is not None:
+            self._static_vars.move_to_end(key)
+        else:
+            # --- CORRECTED LOGIC: Only look for rules if doc_type is provided ---
+            schema_rules = ""
+            if doc_type:
+                schema_rules = self.prompts.get(doc_type.value.lower(), "")
+            schema = model.model_json_schema()
+            if schema_keys is not None:
+                schema = prune_json_schema(schema, schema_keys)
+            static_vars = {
+                "pydantic_schema_json": json.dumps(schema, indent=2),
+                "schema_specific_rules": schema_rules,
+            }
+            self._static_vars[key] = static_vars
+            if len(self._static_vars) > PROMPT_SCHEMA_CACHE_SIZE:
+                self._static_vars.popitem(last=False)
+        return static_vars
+
     # --- CORRECTED METHOD SIGNATURE ---
     # 'variables' is now a required positional argument again, and
     # 'doc_type' is an optional keyword argument.
     def get_prepared_prompt(
-        self, name: str, model: Type[BaseModel], variables: Dict[str, Any], doc_type: Optional[DocumentType] = None
+        self,
+        name: str,
+        model: Type[BaseModel],
+        variables: Dict[str, Any],
+        doc_type: Optional[DocumentType] = None,
+        schema_keys: Optional[Iterable[str]] = None,
     ) -> str:
-        template = self.prompts.get(name)
+        """
+        Renders a prompt. If `schema_keys` is given, the embedded schema only
+        describes those top-level fields and the $defs they reference.
+        """
+        template = self.compiled.get(name)
         if not template:
             raise ValueError(f"Prompt '{name}' not found.")
 
-        # --- CORRECTED LOGIC: Only look for rules if doc_type is provided ---
-        schema_rules = ""
-        if doc_type:
-            schema_rules = self.prompts.get(doc_type.value.lower(), "")
-
-        schema = json.dumps(model.model_json_schema(), indent=2)
-
+        if schema_keys is not None:
+            schema_keys = frozenset(schema_keys)
         all_vars = {
-            "pydantic_schema_json": schema,
-            "schema_specific_rules": schema_rules,
+            **self._get_static_vars(model, doc_type, schema_keys),
             **variables
         }
-
-        for key, value in all_vars.items():
-            template = template.replace(f"{{{{{key}}}}}", str(value))
-        return template
+        return template.render(all_vars)
 
 prompt_manager = PromptManager(PROMPT_DIR)
 
+class StoppingPolicy(BaseModel):
+    """
+    When to stop reading chunks: every field in `saturation_fields` is populated
+    (default: the model's required and scalar fields) and no list or mapping
+    field has grown for `patience` chunks.
+    """
+    enabled: bool = EARLY_STOP_ENABLED
+    patience: int = EARLY_STOP_PATIENCE
+    saturation_fields: Optional[Set[str]] = None
+
 class SchemaMetadata(BaseModel):
     model: Type[BaseModel]
+    # Bump when the extraction of this type changes in ways its schema does not
+    # show (e.g. merge keys or repairers), to invalidate cached documents.
+    version: int = 1
     complexity: Literal["low", "medium", "high"]
+    stopping: StoppingPolicy = StoppingPolicy()
+    # Natural keys per $defs name, used to merge list entries found in several chunks (see MergeAccumulator).
+    natural_keys: Dict[str, List[Tuple[str, ...]]] = {}
+    # Fills fields from a chunk without the LLM; returns them and whether they form a complete document.
+    local_extractor: Optional[Callable[[str], Tuple[Dict[str, Any], bool]]] = None
 
 SCHEMA_REGISTRY: Dict[DocumentType, SchemaMetadata] = {
-    DocumentType.RESUME: SchemaMetadata(model=Resume, complexity="medium"),
-    DocumentType.CITATION: SchemaMetadata(model=CitationFile, complexity="high"),
-    DocumentType.README: SchemaMetadata(model=GitHubAction, complexity="medium"),
+    DocumentType.RESUME: SchemaMetadata(
+        model=Resume, complexity="medium",
+        stopping=StoppingPolicy(saturation_fields={"basics"}),
+        natural_keys={
+            "Profile": [("network", "username"), ("url",)],
+            "WorkItem": [("name", "startDate")],
+            "VolunteerItem": [("organization", "startDate")],
+            "EducationItem": [("institution", "studyType", "area")],
+            "AwardItem": [("title",)],
+            "CertificateItem": [("name",)],
+            "PublicationItem": [("name",)],
+            "SkillItem": [("name",)],
+            "LanguageItem": [("language",)],
+            "InterestItem": [("name",)],
+            "ReferenceItem": [("name",)],
+            "ProjectItem": [("name",)],
+        },
+    ),
+    # References usually sit at the end of a paper, so citations are always read in full.
+    DocumentType.CITATION: SchemaMetadata(
+        model=CitationFile, complexity="high",
+        stopping=StoppingPolicy(enabled=False),
+        natural_keys={
+            "Reference": [("doi",), ("title",)],
+            "Person": [("orcid",), ("family_names", "given_names")],
+            "Entity": [("name",)],
+        },
+    ),
+    DocumentType.README: SchemaMetadata(
+        model=GitHubAction, complexity="medium",
+        stopping=StoppingPolicy(saturation_fields={"name", "description", "runs"}),
+        local_extractor=extract_action_yaml,
+    ),
 }
 
-def _deep_merge_dicts(source: dict, destination: dict) -> dict:
-    """Recursively merges source dict into destination dict."""
-    for key, value in source.items():
-        if isinstance(value, dict):
-            node = destination.setdefault(key, {})
-            _deep_merge_dicts(value, node)
-        elif isinstance(value, list):
-            if key not in destination or not isinstance(destination.get(key), list):
-                destination[key] = []
-            # Avoid duplicates in lists of strings/numbers
-            if all(isinstance(item, (str, int, float)) for item in value):
-                 destination[key].extend([v for v in value if v not in destination[key]])
-            else: # For lists of objects, append all
-                 destination[key].extend(value)
-        else:
-            if key not in destination: # Only set if not already present
-                destination[key] = value
-    return destination
+def _registry_fingerprint() -> str:
+    """Hash of every registered type's version and JSON schema."""
+    registry = {
+        doc_type.value: {"version": metadata.version, "schema": metadata.model.model_json_schema()}
+        for doc_type, metadata in SCHEMA_REGISTRY.items()
+    }
+    return hashlib.blake2b(json.dumps(registry, sort_keys=True).encode("utf-8"), digest_size=16).hexdigest()
+
+SCHEMA_REGISTRY_FINGERPRINT = _registry_fingerprint()
+
+def pipeline_version(extraction_mode: ExtractionMode, pdf_backend: str) -> str:
+    """
+    Identifies everything besides the upload itself that determines a result:
+    the model, the prompt files, the registered schemas, the request options and
+    the settings that decide chunk boundaries, early stopping, classification
+    and correction.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    settings = {
+        "MODEL_CONTEXT_TOKENS": MODEL_CONTEXT_TOKENS,
+        "RESPONSE_TOKEN_RESERVE": RESPONSE_TOKEN_RESERVE,
+        "CHUNK_OVERLAP_TOKENS": CHUNK_OVERLAP_TOKENS,
+        "MAX_CHUNK_TOKENS": MAX_CHUNK_TOKENS,
+        "INCREMENTAL_CHUNK_TOKENS": INCREMENTAL_CHUNK_TOKENS,
+        "MIN_SPLIT_CHUNK_CHARS": MIN_SPLIT_CHUNK_CHARS,
+        "CHUNK_WAVE_SIZE": CHUNK_WAVE_SIZE,
+        "EARLY_STOP_ENABLED": EARLY_STOP_ENABLED,
+        "EARLY_STOP_PATIENCE": EARLY_STOP_PATIENCE,
+        "LOCAL_CLASSIFIER_THRESHOLD": LOCAL_CLASSIFIER_THRESHOLD,
+        "MAX_TARGETED_CORRECTIONS": MAX_TARGETED_CORRECTIONS,
+    }
+    parts = [
+        MODEL_NAME, SCHEMA_REGISTRY_FINGERPRINT, extraction_mode, pdf_backend,
+        *(f"{name}={value}" for name, value in sorted(settings.items())),
+        *(f"{name}={prompt_hash}" for name, prompt_hash in sorted(prompt_manager.prompt_hashes.items())),
+    ]
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+_chunk_schema_hashes: Dict[DocumentType, str] = {}
+
+def chunk_schema_hash(doc_type: DocumentType) -> str:
+    """
+    Identifies what a stateless chunk extraction of `doc_type` depends on
+    besides the chunk: the model, the type's schema and version, and the
+    extraction prompt and rules.
+    """
+    schema_hash = _chunk_schema_hashes.get(doc_type)
+    if schema_hash is None:
+        metadata = SCHEMA_REGISTRY[doc_type]
+        parts = {
+            "model": MODEL_NAME,
+            "version": metadata.version,
+            "schema": metadata.model.model_json_schema(),
+            "prompt": prompt_manager.prompt_hashes["extraction"],
+            "rules": prompt_manager.prompt_hashes.get(doc_type.value.lower()),
+        }
+        schema_hash = hashlib.blake2b(json.dumps(parts, sort_keys=True).encode("utf-8"), digest_size=16).hexdigest()
+        _chunk_schema_hashes[doc_type] = schema_hash
+    return schema_hash
+
+chunk_planner = ChunkPlanner(
+    context_tokens=MODEL_CONTEXT_TOKENS,
+    response_tokens=RESPONSE_TOKEN_RESERVE,
+    overlap_tokens=CHUNK_OVERLAP_TOKENS,
+    max_chunk_tokens=MAX_CHUNK_TOKENS or None,
+)
+_chunk_splitters: Dict[DocumentType, Tuple[TextSplitter, int]] = {}
+_chunk_budgets: Dict[DocumentType, int] = {}
+
+def get_chunk_splitter(doc_type: DocumentType) -> Tuple[TextSplitter, int]:
+    """
+    Returns the token-budgeted splitter for a document type and the number of
+    characters to buffer before splitting. The budget is measured against the
+    extraction prompt rendered with an empty chunk and every key still missing.
+    """
+    if doc_type not in _chunk_splitters:
+        model = SCHEMA_REGISTRY[doc_type].model
+        prompt_overhead = prompt_manager.get_prepared_prompt(
+            "extraction_stateful",
+            model,
+            variables={
+                "document_content": "",
+                "document_type": doc_type.value,
+                "extracted_keys": "None",
+                "missing_keys": ", ".join(sorted(model.model_fields)),
+            },
+            doc_type=doc_type
+        )
+        _chunk_splitters[doc_type] = chunk_planner.make_splitter(prompt_overhead)
+        _chunk_budgets[doc_type] = chunk_planner.chunk_budget(prompt_overhead)
+    return _chunk_splitters[doc_type]
+
+def get_chunk_budget(doc_type: DocumentType) -> int:
+    """The chunk size in tokens used by get_chunk_splitter for a document type."""
+    get_chunk_splitter(doc_type)
+    return _chunk_budgets[doc_type]
+
+_collection_fields: Dict[Type[BaseModel], Set[str]] = {}
+
+def get_collection_fields(model: Type[BaseModel]) -> Set[str]:
+    """Top-level list and mapping fields of a model, which accumulate across chunks."""
+    if model not in _collection_fields:
+        _collection_fields[model] = collection_fields(model.model_json_schema())
+    return _collection_fields[model]
+
+class SaturationTracker:
+    """Applies a StoppingPolicy to the merged data after each chunk."""
+    def __init__(self, model: Type[BaseModel], policy: StoppingPolicy):
+        self.policy = policy
+        schema = model.model_json_schema()
+        self.saturation_fields = policy.saturation_fields or (
+            set(schema.get("required", [])) | scalar_fields(schema)
+        )
+        self.growing_fields = get_collection_fields(model)
+        self._sizes: Dict[str, int] = {}
+        self._stale_chunks = 0
+
+    def update(self, merged_data: Dict[str, Any]) -> bool:
+        """Records one processed chunk and returns True once extraction can stop."""
+        sizes = {f: len(merged_data.get(f) or ()) for f in self.growing_fields}
+        self._stale_chunks = self._stale_chunks + 1 if sizes == self._sizes else 0
+        self._sizes = sizes
+        if not self.policy.enabled:
+            return False
+        populated = all(merged_data.get(f) not in (None, "", [], {}) for f in self.saturation_fields)
+        return populated and self._stale_chunks >= self.policy.patience
+
+async def _iter_single_text(content: str) -> AsyncIterator[str]:
+    yield content
+
+# Receives progress updates such as {"stage": "extracting", "chunks_processed": 3}.
+ProgressCallback = Callable[[Dict[str, Any]], Awaitable[None]]
 
 # In main.py
 
+def _is_classification(content: str) -> bool:
+    try:
+        SimpleClassification.model_validate_json(content)
+        return True
+    except ValidationError:
+        return False
+
 class DocumentProcessor:
     """
     Encapsulates the logic for processing a document using a robust
     Map -> Merge -> Validate -> Correct strategy.
+    The content may be a string or an async stream of text (e.g. one item per
+    page), in which case chunks are extracted while later pages are still parsed.
     """
-    def __init__(self, content: str):
-        self.content = content
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=CHUNK_SIZE,
-            chunk_overlap=CHUNK_OVERLAP
-        )
+    def __init__(
+        self,
+        content: Union[str, AsyncIterator[str]],
+        extraction_mode: ExtractionMode = EXTRACTION_MODE,
+        max_concurrency: int = MAX_CONCURRENT_CHUNKS,
+        wave_size: int = CHUNK_WAVE_SIZE,
+        file_ext: str = "",
+        progress_callback: Optional[ProgressCallback] = None,
+    ):
+        if extraction_mode not in ("sequential", "parallel", "incremental"):
+            raise ValueError(f"Unknown extraction mode: '{extraction_mode}'")
+        self.text_stream = _iter_single_text(content) if isinstance(content, str) else content
+        self.extraction_mode = extraction_mode
+        self.max_concurrency = max(1, max_concurrency)
+        self.wave_size = max(1, wave_size)
+        self.file_ext = file_ext
+        self.chunks_processed = 0
+        self.chunks_skipped = 0
+        self.chunks_reused = 0
+        # The last step needed to make the data valid: none, repair, targeted or full.
+        self.correction = "none"
+        self.progress_callback = progress_callback
+        self.document_type: Optional[DocumentType] = None
+
+    async def _report_progress(self, stage: str) -> None:
+        if self.progress_callback is not None:
+            await self.progress_callback({
+                "stage": stage,
+                "document_type": self.document_type.value if self.document_type else None,
+                "chunks_processed": self.chunks_processed,
+                "chunks_skipped": self.chunks_skipped,
+                "chunks_reused": self.chunks_reused,
+            })
 
     async def run_async(self) -> Dict[str, Any]:
         """
         Main orchestration method that processes, validates, and corrects the data.
+        Parsing, classification and chunk preparation run as overlapping stages:
+        classification starts as soon as the first CHUNK_SIZE characters exist,
+        while the remaining pages keep being parsed and chunked in the background.
         """
+        self._stage_tasks: List[asyncio.Task] = []
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await self._run_pipeline_async()
+            outcome = "ok"
+            return result
+        finally:
+            await self._cancel_stage_tasks()
+            self._record_metrics(time.perf_counter() - started, outcome)
+
+    async def _cancel_stage_tasks(self) -> None:
+        for task in self._stage_tasks:
+            task.cancel()
+        await asyncio.gather(*self._stage_tasks, return_exceptions=True)
+
+    def _record_metrics(self, seconds: float, outcome: str) -> None:
+        document_type = self.document_type.value if self.document_type else "unknown"
+        DOCUMENT_SECONDS.observe(seconds, document_type=document_type, outcome=outcome)
+        DOCUMENT_CHUNKS.observe(self.chunks_processed, kind="processed")
+        DOCUMENT_CHUNKS.observe(self.chunks_reused, kind="reused")
+        DOCUMENT_CHUNKS.observe(self.chunks_skipped, kind="skipped")
+        if outcome == "ok":
+            DOCUMENTS.inc(document_type=document_type, correction=self.correction)
+
+    async def _pump_text_async(self, text_queue: asyncio.Queue, prefix_ready: asyncio.Future) -> None:
+        """
+        Parsing stage: moves the parsed text into `text_queue` and resolves
+        `prefix_ready` with the first CHUNK_SIZE characters.
+        """
+        prefix = ""
+        try:
+            async for text in self.text_stream:
+                if not prefix_ready.done():
+                    prefix += text
+                    # A full queue means nobody reads yet, so classify on what exists.
+                    if len(prefix) >= CHUNK_SIZE or text_queue.full():
+                        prefix_ready.set_result(prefix[:CHUNK_SIZE])
+                await text_queue.put(text)
+        except Exception as e:
+            if not prefix_ready.done():
+                prefix_ready.set_exception(e)
+            await text_queue.put(e)
+            return
+        if not prefix_ready.done():
+            prefix_ready.set_result(prefix)
+        await text_queue.put(END)
+
+    def _start_chunk_preparation(self, text_source: AsyncIterator[str], doc_type: DocumentType) -> asyncio.Queue:
+        """
+        Chunking stage: splits `text_source` for `doc_type` into a new bounded queue.
+        The incremental mode cuts at content-defined points instead of packing
+        chunks greedily, so unchanged parts of an edited document keep their chunks.
+        """
+        text_splitter, buffer_chars = get_chunk_splitter(doc_type)
+        chunk_queue: asyncio.Queue = asyncio.Queue(maxsize=CHUNK_QUEUE_SIZE)
+        if self.extraction_mode == "incremental":
+            max_tokens = min(get_chunk_budget(doc_type), INCREMENTAL_CHUNK_TOKENS)
+            chunks = iter_content_defined_chunks_async(
+                text_source, text_splitter, chunk_planner.count_tokens, max_tokens
+            )
+        else:
+            chunks = iter_chunks_async(text_source, text_splitter, min_buffer_chars=buffer_chars)
+        self._stage_tasks.append(asyncio.create_task(feed_queue_async(chunks, chunk_queue)))
+        return chunk_queue
+
+    async def _run_pipeline_async(self) -> Dict[str, Any]:
+        text_queue: asyncio.Queue = asyncio.Queue(maxsize=TEXT_QUEUE_SIZE)
+        prefix_ready = asyncio.get_running_loop().create_future()
+        self._stage_tasks.append(asyncio.create_task(self._pump_text_async(text_queue, prefix_ready)))
+        text_reader = ReplayableQueueReader(text_queue)
+
         # --- Step 1: Classification ---
-        print("--- Step 1: Classification ---")
-        first_chunk = self.content[:CHUNK_SIZE]
-        classification_result = await self._classify_document_async(first_chunk)
+        logger.info("Step 1: classification")
+        await self._report_progress("classifying")
+        first_chunk = await prefix_ready
+        classification_started = time.perf_counter()
+        local_result, confidence = classify_locally(first_chunk, self.file_ext)
+
+        # Chunk preparation starts right away for the local guess; it is redone
+        # from the recorded text if the final classification disagrees.
+        guessed_type = local_result.type if local_result.type in SCHEMA_REGISTRY else None
+        chunk_queue = None
+        if guessed_type is not None:
+            chunk_queue = self._start_chunk_preparation(text_reader.read(), guessed_type)
+
+        classification_result = await self._classify_document_async(first_chunk, local_result, confidence)
+        STAGE_SECONDS.observe(time.perf_counter() - classification_started, stage="classification")
         doc_type = classification_result.type
-        print(f"   -> Classified as: {doc_type.value}")
+        logger.info("Classified as: %s", doc_type.value)
 
         if doc_type == DocumentType.OTHER:
             raise HTTPException(status_code=400, detail="Document type could not be determined.")
@@ -141,118 +627,804 @@ class DocumentProcessor:
             raise HTTPException(status_code=404, detail=f"No extraction schema for type: '{doc_type.value}'")
 
         # --- Step 2: Map & Merge All Chunks ---
-        print("--- Step 2: Extracting and Merging All Chunks ---")
-        chunks = self.text_splitter.split_text(self.content)
-        print(f"   -> Document split into {len(chunks)} chunks.")
+        logger.info("Step 2: extracting and merging all chunks")
+        self.document_type = doc_type
+        await self._report_progress("extracting")
+        if doc_type != guessed_type:
+            if chunk_queue is not None:
+                logger.info("Re-chunking: chunks were prepared for '%s'.", guessed_type.value)
+                speculative_task = self._stage_tasks.pop()
+                speculative_task.cancel()
+                await asyncio.gather(speculative_task, return_exceptions=True)
+            chunk_queue = self._start_chunk_preparation(text_reader.replay(), doc_type)
+        text_reader.commit()
+        chunks = iter_queue_async(chunk_queue)
 
-        final_extracted_data = {}
-        extracted_keys: Set[str] = set()
+        tracker = SaturationTracker(metadata.model, metadata.stopping)
+        accumulator = MergeAccumulator(metadata.model.model_json_schema(), metadata.natural_keys)
+        with STAGE_SECONDS.time(stage="extraction"):
+            if self.extraction_mode == "parallel":
+                await self._extract_chunks_parallel_async(chunks, doc_type, metadata.model, accumulator, tracker)
+            elif self.extraction_mode == "incremental":
+                await self._extract_chunks_incremental_async(chunks, doc_type, metadata.model, accumulator, tracker)
+            else:
+                await self._extract_chunks_sequential_async(chunks, doc_type, metadata.model, accumulator, tracker)
+        final_extracted_data = accumulator.data
 
-        for i, chunk in enumerate(chunks):
-            print(f"   -> Processing chunk {i+1}/{len(chunks)}...")
-            partial_data = await self._extract_from_chunk_async(chunk, doc_type, metadata.model, extracted_keys)
-            if partial_data:
-                final_extracted_data = _deep_merge_dicts(partial_data, final_extracted_data)
-                newly_found_keys = {k for k, v in partial_data.items() if v is not None}
-                extracted_keys.update(newly_found_keys)
-                print(f"      -> Found keys: {newly_found_keys}")
+        # After an early stop the rest of the document is not needed, so parsing and
+        # chunking are cancelled rather than drained. Only the chunks already
+        # prepared are counted, which makes chunks_skipped a lower bound.
+        await self._cancel_stage_tasks()
+        while not chunk_queue.empty():
+            item = chunk_queue.get_nowait()
+            if item is not END and not isinstance(item, BaseException):
+                self.chunks_skipped += 1
+        logger.info(
+            "Processed %d chunks (%d reused), skipped %d.",
+            self.chunks_processed, self.chunks_reused, self.chunks_skipped,
+            extra={"fields": {
+                "chunks_processed": self.chunks_processed,
+                "chunks_reused": self.chunks_reused,
+                "chunks_skipped": self.chunks_skipped,
+            }},
+        )
 
         # --- Step 3 & 4: Validate and Correct ---
+        await self._report_progress("validating")
         try:
-            print("--- Step 3: Final Validation ---")
-            validated_data = metadata.model.model_validate(final_extracted_data)
-            print("   -> Validation successful on the first attempt.")
-            return {"classification": classification_result, "structured_data": validated_data}
+            logger.info("Step 3: final validation")
+            with STAGE_SECONDS.time(stage="validation"):
+                validated_data = metadata.model.model_validate(final_extracted_data)
+            logger.info("Validation successful on the first attempt.")
+            return self._build_result(classification_result, validated_data)
 
         except ValidationError as e:
-            print("\n--- Step 4: Validation Failed. Initiating Correction Pass ---")
-            print(f"   -> Validation Errors: {e}")
+            logger.info("Step 3b: local repair")
+            with STAGE_SECONDS.time(stage="repair"):
+                final_extracted_data, fixes = repair_document(metadata.model, final_extracted_data, e)
+                if fixes:
+                    try:
+                        validated_data = metadata.model.model_validate(final_extracted_data)
+                        logger.info("%d local fix(es) made the data valid.", fixes)
+                        self.correction = "repair"
+                        return self._build_result(classification_result, validated_data)
+                    except ValidationError as remaining:
+                        logger.info("%d local fix(es) applied; errors remain.", fixes)
+                        e = remaining
+
+            logger.info("Step 4: validation failed; starting the correction pass")
+            logger.debug("Validation errors: %s", e)
+            await self._report_progress("correcting")
+            with STAGE_SECONDS.time(stage="correction"):
+                validated_data = await self._correct_async(final_extracted_data, e, doc_type, metadata.model)
+            return self._build_result(classification_result, validated_data)
+
+    async def _correct_async(
+        self, data: Dict[str, Any], error: ValidationError, doc_type: DocumentType, model: Type[BaseModel]
+    ) -> BaseModel:
+        """
+        Step 4. Errors are grouped by the sub-object they occur in (a list entry
+        or a top-level field) and every such sub-object is corrected on its own,
+        in parallel, with only its part of the schema. Errors at the document
+        root, or left over after the targeted pass, are corrected on the whole document.
+        """
+        groups = group_errors(data, error.errors())
+        if ROOT not in groups and len(groups) <= MAX_TARGETED_CORRECTIONS:
+            logger.info("Correcting %d sub-object(s): %s", len(groups), ", ".join(map(str, groups)))
+            data = await self._correct_targets_async(data, groups, doc_type, model)
+            try:
+                validated_data = model.model_validate(data)
+                logger.info("Targeted correction and re-validation successful.")
+                self.correction = "targeted"
+                return validated_data
+            except ValidationError as remaining:
+                logger.info("Errors remain after targeted correction: %s", remaining)
+                error = remaining
+        self.correction = "full"
+        return await self._correct_document_async(data, error, doc_type, model)
+
+    async def _correct_targets_async(
+        self,
+        data: Dict[str, Any],
+        groups: Dict[JsonPath, List[Dict[str, Any]]],
+        doc_type: DocumentType,
+        model: Type[BaseModel],
+    ) -> Dict[str, Any]:
+        """Sends each failing sub-object with its sub-schema for correction and splices the fixes back in."""
+        schema = model.model_json_schema()
+
+        async def correct(anchor: JsonPath, errors: List[Dict[str, Any]]) -> Optional[Any]:
+            target = get_at(data, anchor)
+            target_schema = sub_schema(schema, anchor)
+            errors_relative_to = anchor
+            # The model only answers with JSON objects, so other values are wrapped in one.
+            name = str(anchor[-1])
+            wrapped = not isinstance(target, dict)
+            if wrapped:
+                defs = target_schema.pop("$defs", None)
+                target = {name: target}
+                target_schema = {"type": "object", "properties": {name: target_schema}, "required": [name]}
+                if defs:
+                    target_schema["$defs"] = defs
+                errors_relative_to = anchor[:-1]
 
-            correction_prompt = prompt_manager.get_prepared_prompt(
+            prompt = prompt_manager.get_prepared_prompt(
                 "correction",
-                metadata.model,
+                model,
                 variables={
-                    "invalid_json": json.dumps(final_extracted_data, indent=2),
-                    "validation_errors": str(e)
+                    "pydantic_schema_json": json.dumps(target_schema, indent=2),
+                    "invalid_json": json.dumps(target, indent=2),
+                    "validation_errors": format_errors(errors, errors_relative_to),
                 },
                 doc_type=doc_type
             )
-            
-            print("   -> Sending data to LLM for correction...")
-            corrected_json_str = await run_inference_async(correction_prompt, MODEL_NAME)
-            
             try:
-                corrected_data = json.loads(corrected_json_str)
-                print("   -> Re-validating the corrected JSON...")
-                validated_data = metadata.model.model_validate(corrected_data)
-                print("   -> Correction and re-validation successful!")
-                return {"classification": classification_result, "structured_data": validated_data}
-            except (json.JSONDecodeError, ValidationError) as final_error:
-                print(f"   -> FATAL: Correction pass failed to produce valid JSON. Error: {final_error}")
-                raise HTTPException(
-                    status_code=422, # Unprocessable Entity
-                    detail=f"The model could not correct its own validation errors. Last error: {final_error}"
-                )
+                # Corrections are not cached: one that does not validate must be retried.
+                fixed = json.loads(await run_inference_async(
+                    prompt, MODEL_NAME, use_cache=False, max_tokens=RESPONSE_TOKEN_RESERVE
+                ))
+            except (json.JSONDecodeError, TruncatedResponseError):
+                logger.warning("LLM produced invalid JSON correcting %s. Keeping it as is.", anchor)
+                return None
+            if wrapped:
+                return fixed.get(name) if isinstance(fixed, dict) else None
+            return fixed
+
+        fixes = await asyncio.gather(*(correct(anchor, errors) for anchor, errors in groups.items()))
+        for anchor, fixed in zip(groups, fixes):
+            if fixed is not None:
+                data = set_at(data, anchor, fixed)
+        return data
+
+    async def _correct_document_async(
+        self, data: Dict[str, Any], error: ValidationError, doc_type: DocumentType, model: Type[BaseModel]
+    ) -> BaseModel:
+        """Sends the whole document, its schema and the errors for correction."""
+        correction_prompt = prompt_manager.get_prepared_prompt(
+            "correction",
+            model,
+            variables={
+                "invalid_json": json.dumps(data, indent=2),
+                "validation_errors": str(error)
+            },
+            doc_type=doc_type
+        )
+
+        logger.info("Sending the whole document to the LLM for correction.")
+        try:
+            corrected_json_str = await run_inference_async(
+                correction_prompt, MODEL_NAME, use_cache=False, max_tokens=RESPONSE_TOKEN_RESERVE
+            )
+            corrected_data = json.loads(corrected_json_str)
+            logger.debug("Re-validating the corrected JSON.")
+            validated_data = model.model_validate(corrected_data)
+            logger.info("Correction and re-validation successful.")
+            return validated_data
+        except (json.JSONDecodeError, ValidationError, TruncatedResponseError) as final_error:
+            logger.error("Correction pass failed to produce valid JSON: %s", final_error)
+            raise HTTPException(
+                status_code=422, # Unprocessable Entity
+                detail=f"The model could not correct its own validation errors. Last error: {final_error}"
+            )
+
+    def _build_result(self, classification_result: SimpleClassification, validated_data: BaseModel) -> Dict[str, Any]:
+        return {
+            "classification": classification_result,
+            "structured_data": validated_data,
+            "chunks_processed": self.chunks_processed,
+            "chunks_skipped": self.chunks_skipped,
+        }
+
+    async def _extract_chunks_sequential_async(
+        self,
+        chunks: AsyncIterator[str],
+        doc_type: DocumentType,
+        model: Type[BaseModel],
+        accumulator: MergeAccumulator,
+        tracker: SaturationTracker,
+    ) -> None:
+        """Extracts chunks one at a time, each call seeing every key found before it."""
+        extracted_keys: Set[str] = set()
+
+        async for chunk in chunks:
+            self.chunks_processed += 1
+            with log_context(chunk_index=self.chunks_processed - 1):
+                logger.debug("Processing chunk.")
+                with STAGE_SECONDS.time(stage="chunk_extraction"):
+                    partial_data = await self._extract_from_chunk_async(chunk, doc_type, model, extracted_keys)
+                merged_data = self._merge_partial(partial_data, accumulator, extracted_keys)
+            await self._report_progress("extracting")
+            if tracker.update(merged_data):
+                logger.info("Schema saturated; stopping early.")
+                break
+
+    async def _extract_chunks_parallel_async(
+        self,
+        chunks: AsyncIterator[str],
+        doc_type: DocumentType,
+        model: Type[BaseModel],
+        accumulator: MergeAccumulator,
+        tracker: SaturationTracker,
+    ) -> None:
+        """
+        Extracts chunks concurrently in speculative waves of `wave_size` chunks.
+        At most `max_concurrency` calls are in flight at once. Every chunk of a wave
+        sees the keys found by the earlier waves only, and results are merged in
+        chunk order so the output does not depend on which call finishes first.
+        The stopping policy is checked between waves.
+        """
+        extracted_keys: Set[str] = set()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def extract(index: int, chunk: str, known_keys: Set[str]) -> Dict[str, Any]:
+            async with semaphore:
+                with log_context(chunk_index=index):
+                    logger.debug("Processing chunk.")
+                    with STAGE_SECONDS.time(stage="chunk_extraction"):
+                        return await self._extract_from_chunk_async(chunk, doc_type, model, known_keys)
+
+        async def run_wave(wave: List[str]) -> bool:
+            start = self.chunks_processed
+            self.chunks_processed += len(wave)
+            known_keys = set(extracted_keys)
+            logger.debug("Dispatching chunks %d-%d in parallel.", start, start + len(wave) - 1)
+            results = await asyncio.gather(
+                *(extract(start + j, chunk, known_keys) for j, chunk in enumerate(wave))
+            )
+            saturated = False
+            for j, partial_data in enumerate(results):
+                with log_context(chunk_index=start + j):
+                    merged_data = self._merge_partial(partial_data, accumulator, extracted_keys)
+                saturated = tracker.update(merged_data)
+            await self._report_progress("extracting")
+            return saturated
+
+        wave: List[str] = []
+        async for chunk in chunks:
+            wave.append(chunk)
+            if len(wave) == self.wave_size:
+                if await run_wave(wave):
+                    logger.info("Schema saturated; stopping early.")
+                    return
+                wave = []
+        if wave:
+            await run_wave(wave)
+
+    async def _extract_chunks_incremental_async(
+        self,
+        chunks: AsyncIterator[str],
+        doc_type: DocumentType,
+        model: Type[BaseModel],
+        accumulator: MergeAccumulator,
+        tracker: SaturationTracker,
+    ) -> None:
+        """
+        Extracts every chunk statelessly, so a chunk's result only depends on
+        its text and can be memoized in the chunk store. Chunks already in the
+        store are reused; only new or changed chunks call the LLM, concurrently
+        in waves like the parallel mode. Results are merged in chunk order.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        schema_hash = chunk_schema_hash(doc_type)
+
+        async def extract(index: int, chunk: str) -> Dict[str, Any]:
+            key = None
+            if chunk_store is not None:
+                chunk_hash = hashlib.blake2b(chunk.encode("utf-8"), digest_size=20).hexdigest()
+                key = ChunkResultStore.make_key(chunk_hash, doc_type.value, schema_hash)
+                cached = await chunk_store.get(key)
+                record_cache_lookup("chunk", cached is not None)
+                if cached is not None:
+                    self.chunks_reused += 1
+                    return cached
+            async with semaphore:
+                with log_context(chunk_index=index):
+                    logger.debug("Processing chunk.")
+                    with STAGE_SECONDS.time(stage="chunk_extraction"):
+                        partial_data = await self._extract_from_chunk_async(chunk, doc_type, model, None)
+            # An empty result may be a failed call, so it is not memoized.
+            if key is not None and partial_data:
+                await chunk_store.set(key, partial_data)
+            return partial_data
+
+        async def run_wave(wave: List[str]) -> bool:
+            start = self.chunks_processed
+            self.chunks_processed += len(wave)
+            results = await asyncio.gather(*(extract(start + j, chunk) for j, chunk in enumerate(wave)))
+            saturated = False
+            for j, partial_data in enumerate(results):
+                with log_context(chunk_index=start + j):
+                    merged_data = self._merge_partial(partial_data, accumulator, set())
+                saturated = tracker.update(merged_data)
+            await self._report_progress("extracting")
+            return saturated
+
+        wave: List[str] = []
+        async for chunk in chunks:
+            wave.append(chunk)
+            if len(wave) == self.wave_size:
+                if await run_wave(wave):
+                    logger.info("Schema saturated; stopping early.")
+                    return
+                wave = []
+        if wave:
+            await run_wave(wave)
+
+    @staticmethod
+    def _merge_partial(
+        partial_data: Dict[str, Any], accumulator: MergeAccumulator, extracted_keys: Set[str]
+    ) -> Dict[str, Any]:
+        """Merges one chunk's output and records the keys it filled."""
+        if partial_data:
+            with STAGE_SECONDS.time(stage="merge"):
+                accumulator.merge(partial_data)
+            newly_found_keys = {k for k, v in partial_data.items() if v is not None}
+            extracted_keys.update(newly_found_keys)
+            logger.debug("Found keys: %s", newly_found_keys)
+        return accumulator.data
+
+    async def _classify_document_async(
+        self, content_chunk: str, local_result: SimpleClassification, confidence: float
+    ) -> SimpleClassification:
+        """
+        Helper to classify the document type from the first chunk.
+        The local keyword classifier's result is used when its confidence
+        reaches LOCAL_CLASSIFIER_THRESHOLD; otherwise the LLM is asked.
+        """
+        if confidence >= LOCAL_CLASSIFIER_THRESHOLD:
+            logger.info("Local classifier: %s (confidence %.2f)", local_result.type.value, confidence)
+            return local_result
+        logger.info("Local classifier unsure (%.2f); asking the LLM.", confidence)
 
-    async def _classify_document_async(self, content_chunk: str) -> SimpleClassification:
-        """Helper to classify the document type from the first chunk."""
         prompt = prompt_manager.get_prepared_prompt(
             "classification",
             SimpleClassification,
             {"document_content": content_chunk}
         )
-        classification_json = await run_inference_async(prompt, MODEL_NAME)
+        classification_json = await run_inference_async(
+            prompt, MODEL_NAME, accept=_is_classification, max_tokens=RESPONSE_TOKEN_RESERVE
+        )
         return SimpleClassification.model_validate_json(classification_json)
 
     async def _extract_from_chunk_async(
-        self, chunk: str, doc_type: DocumentType, model: Type[BaseModel], extracted_keys: Set[str]
+        self, chunk: str, doc_type: DocumentType, model: Type[BaseModel], extracted_keys: Optional[Set[str]]
     ) -> Dict[str, Any]:
-        """Helper to extract data from a single chunk (the "Map" step)."""
+        """
+        Helper to extract data from a single chunk (the "Map" step).
+        The type's local extractor (if any) runs first; the LLM is only asked
+        for the fields it could not fill, and not at all if it found a complete
+        document. The prompt's schema is pruned to the missing fields plus the
+        list and mapping fields, which can still gain entries from any chunk.
+        With `extracted_keys=None` the stateless prompt is used, which does not
+        depend on earlier chunks. A chunk whose answer is cut off at the token
+        limit is split in two, and the halves are extracted and merged.
+        """
+        local_data: Dict[str, Any] = {}
+        local_extractor = SCHEMA_REGISTRY[doc_type].local_extractor
+        if local_extractor is not None:
+            local_data, complete = local_extractor(chunk)
+            if complete:
+                logger.debug("Parsed locally; skipping the LLM call.")
+                return local_data
+
+        stateless = extracted_keys is None
+        extracted_keys = (extracted_keys or set()) | set(local_data)
         all_schema_keys = set(model.model_fields.keys())
         missing_keys = all_schema_keys - extracted_keys
+        schema_keys = missing_keys | (get_collection_fields(model) - set(local_data))
+        if not schema_keys:
+            return local_data
 
-        prompt = prompt_manager.get_prepared_prompt(
-            "extraction_stateful",
-            model,
-            variables={
-                "document_content": chunk,
-                "document_type": doc_type.value,
-                "extracted_keys": ", ".join(sorted(list(extracted_keys))) or "None",
-                "missing_keys": ", ".join(sorted(list(missing_keys)))
-            },
-            doc_type=doc_type
-        )
-        extraction_json = await run_inference_async(prompt, MODEL_NAME)
+        if stateless:
+            prompt = prompt_manager.get_prepared_prompt(
+                "extraction",
+                model,
+                variables={"document_content": chunk, "document_type": doc_type.value},
+                doc_type=doc_type,
+                schema_keys=schema_keys
+            )
+        else:
+            prompt = prompt_manager.get_prepared_prompt(
+                "extraction_stateful",
+                model,
+                variables={
+                    "document_content": chunk,
+                    "document_type": doc_type.value,
+                    "extracted_keys": ", ".join(sorted(list(extracted_keys))) or "None",
+                    "missing_keys": ", ".join(sorted(list(missing_keys)))
+                },
+                doc_type=doc_type,
+                schema_keys=schema_keys
+            )
         try:
-            return json.loads(extraction_json)
+            extraction_json = await run_inference_async(prompt, MODEL_NAME, max_tokens=RESPONSE_TOKEN_RESERVE)
+        except TruncatedResponseError:
+            halves = _split_in_half(chunk)
+            if halves is None:
+                logger.warning("LLM response for a chunk was truncated and it cannot be split further. Skipping.")
+                return local_data
+            logger.info("LLM response for a chunk was truncated; extracting its halves separately.")
+            keys = None if stateless else extracted_keys
+            partials = await asyncio.gather(
+                *(self._extract_from_chunk_async(half, doc_type, model, keys) for half in halves)
+            )
+            accumulator = MergeAccumulator(model.model_json_schema(), SCHEMA_REGISTRY[doc_type].natural_keys)
+            for partial in partials:
+                accumulator.merge(partial)
+            return {**accumulator.data, **local_data}
+        try:
+            llm_data = json.loads(extraction_json)
         except json.JSONDecodeError:
-            print(f"      -> Warning: LLM produced invalid JSON for a chunk. Skipping.")
-            return {}
+            logger.warning("LLM produced invalid JSON for a chunk. Skipping.")
+            return local_data
+        # Parsed YAML is exact, so it wins over the LLM's reading of the same fields.
+        return {**llm_data, **local_data}
         
+def _split_in_half(text: str) -> Optional[Tuple[str, str]]:
+    """
+    Splits text at the line break (or else the space) nearest its middle.
+    Returns None for text shorter than MIN_SPLIT_CHUNK_CHARS or without either.
+    """
+    if len(text) < MIN_SPLIT_CHUNK_CHARS:
+        return None
+    middle = len(text) // 2
+    for separator in ("\n", " "):
+        before, after = text.rfind(separator, 0, middle), text.find(separator, middle)
+        candidates = [i for i in (before, after) if i > 0]
+        if candidates:
+            cut = min(candidates, key=lambda i: abs(i - middle)) + 1
+            return text[:cut], text[cut:]
+    return None
+
+def _content_hasher() -> "hashlib.blake2b":
+    return hashlib.blake2b(digest_size=20)
+
+async def _spool_upload_async(
+    file: UploadFile, suffix: str, directory: Optional[str] = None
+) -> Tuple[str, str]:
+    """
+    Copies an upload to a temporary file in fixed-size blocks. Returns its path
+    and the hash of its content, computed on the way.
+    """
+    content_hash = _content_hasher()
+    with tempfile.NamedTemporaryFile(suffix=suffix, dir=directory, delete=False) as spool:
+        try:
+            while block := await file.read(UPLOAD_SPOOL_BLOCK_SIZE):
+                content_hash.update(block)
+                await asyncio.to_thread(spool.write, block)
+        except BaseException:
+            os.unlink(spool.name)
+            raise
+    return spool.name, content_hash.hexdigest()
+
+async def _process_file_async(
+    file_path: str,
+    file_ext: str,
+    extraction_mode: Optional[ExtractionMode] = None,
+    pdf_backend: Optional[str] = None,
+    progress_callback: Optional[ProgressCallback] = None,
+    content_hash: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Streams the text of a spooled upload through a DocumentProcessor. If the
+    upload's content hash is given, a cached result for the same content and
+    pipeline version is returned without parsing the file.
+    """
+    # Logs of this document carry its content hash (or a random id) as the document id.
+    with log_context(document_id=content_hash or uuid.uuid4().hex):
+        extraction_mode = extraction_mode or EXTRACTION_MODE
+        cache_key = None
+        if content_hash is not None and document_cache is not None:
+            cache_key = DocumentResultCache.make_key(content_hash, pipeline_version(extraction_mode, pdf_backend or PDF_BACKEND))
+            cached = await document_cache.get(cache_key)
+            record_cache_lookup("document", cached is not None)
+            if cached is not None:
+                logger.info("Document cache hit for %s.", content_hash)
+                return cached
+
+        text_stream = iter_text_from_file_async(file_path, file_ext, pdf_backend)
+        try:
+            processor = DocumentProcessor(
+                text_stream,
+                extraction_mode=extraction_mode,
+                file_ext=file_ext,
+                progress_callback=progress_callback,
+            )
+            result = await processor.run_async()
+        finally:
+            await text_stream.aclose()
+        if cache_key is not None:
+            await document_cache.set(cache_key, jsonable_encoder(result))
+        return result
+
+def _error_status(e: Exception) -> Tuple[int, str]:
+    """Maps a processing error to the HTTP status code and detail reported to the client."""
+    if isinstance(e, HTTPException):
+        return e.status_code, str(e.detail)
+    if isinstance(e, ValueError):
+        return 400, str(e)
+    logger.error("An unexpected error occurred: %s", e, exc_info=e)
+    return 500, "An internal error occurred while processing the file."
+
+def _extract_zip(zip_path: str, directory: str, max_files: int) -> List[Tuple[str, str, str]]:
+    """
+    Extracts the files of a zip archive into `directory` under generated names,
+    so member paths can never escape it. Returns (member name, path, content hash) triples.
+    The member count and declared sizes are checked before extracting anything,
+    and the bytes actually written are capped per member and in total.
+    """
+    with zipfile.ZipFile(zip_path) as archive:
+        members = [
+            info for info in archive.infolist()
+            if not (info.is_dir() or info.filename.startswith("__MACOSX/")
+                    or os.path.basename(info.filename).startswith("."))
+        ]
+        if len(members) > max_files:
+            raise ValueError(f"A batch may contain at most {BATCH_MAX_FILES} documents.")
+        for info in members:
+            if info.file_size > BATCH_MAX_MEMBER_BYTES:
+                raise ValueError(f"'{info.filename}' is larger than {BATCH_MAX_MEMBER_BYTES} bytes.")
+        if sum(info.file_size for info in members) > BATCH_MAX_UNCOMPRESSED_BYTES:
+            raise ValueError(f"The archive expands to more than {BATCH_MAX_UNCOMPRESSED_BYTES} bytes.")
+
+        documents = []
+        total_bytes = 0
+        for info in members:
+            name = info.filename
+            _, ext = os.path.splitext(name)
+            content_hash = _content_hasher()
+            member_bytes = 0
+            with archive.open(info) as member, tempfile.NamedTemporaryFile(
+                suffix=ext, dir=directory, delete=False
+            ) as target:
+                while block := member.read(UPLOAD_SPOOL_BLOCK_SIZE):
+                    member_bytes += len(block)
+                    total_bytes += len(block)
+                    if member_bytes > BATCH_MAX_MEMBER_BYTES:
+                        raise ValueError(f"'{name}' is larger than {BATCH_MAX_MEMBER_BYTES} bytes.")
+                    if total_bytes > BATCH_MAX_UNCOMPRESSED_BYTES:
+                        raise ValueError(f"The archive expands to more than {BATCH_MAX_UNCOMPRESSED_BYTES} bytes.")
+                    content_hash.update(block)
+                    target.write(block)
+            documents.append((name, target.name, content_hash.hexdigest()))
+    return documents
+
+async def _spool_batch_async(files: List[UploadFile], directory: str) -> List[Tuple[str, str, str]]:
+    """
+    Spools every upload into `directory`, expanding zip archives.
+    Returns (name, path, content hash) triples.
+    """
+    documents: List[Tuple[str, str, str]] = []
+    for file in files:
+        _, file_ext = os.path.splitext(file.filename)
+        file_path, content_hash = await _spool_upload_async(file, file_ext, directory=directory)
+        if file_ext.lower() == ".zip":
+            try:
+                documents.extend(await asyncio.to_thread(
+                    _extract_zip, file_path, directory, BATCH_MAX_FILES - len(documents)
+                ))
+            except zipfile.BadZipFile:
+                raise ValueError(f"'{file.filename}' is not a valid zip archive.")
+            finally:
+                os.unlink(file_path)
+        else:
+            documents.append((file.filename, file_path, content_hash))
+        if len(documents) > BATCH_MAX_FILES:
+            raise ValueError(f"A batch may contain at most {BATCH_MAX_FILES} documents.")
+    return documents
+
+async def _iter_batch_results_async(
+    documents: List[Tuple[str, str, str]],
+    batch_dir: str,
+    extraction_mode: Optional[ExtractionMode],
+    pdf_backend: Optional[str],
+) -> AsyncIterator[str]:
+    """
+    Processes the documents of a batch concurrently and yields one NDJSON line
+    per document in the order they finish. The batch directory is removed when
+    the stream ends or the client disconnects.
+    """
+    semaphore = asyncio.Semaphore(max(1, BATCH_MAX_CONCURRENT_DOCUMENTS))
+
+    async def process(name: str, file_path: str, content_hash: str) -> Dict[str, Any]:
+        async with semaphore:
+            _, file_ext = os.path.splitext(name)
+            try:
+                result = await _process_file_async(
+                    file_path, file_ext, extraction_mode, pdf_backend, content_hash=content_hash
+                )
+                return {"filename": name, "status": "succeeded", "result": jsonable_encoder(result)}
+            except Exception as e:
+                status_code, detail = _error_status(e)
+                return {"filename": name, "status": "failed", "status_code": status_code, "error": detail}
+            finally:
+                Path(file_path).unlink(missing_ok=True)
+
+    tasks = [asyncio.create_task(process(*document)) for document in documents]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield json.dumps(await next_done) + "\n"
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        shutil.rmtree(batch_dir, ignore_errors=True)
+
+document_cache: Optional[DocumentResultCache] = None
+chunk_store: Optional[ChunkResultStore] = None
+
+# --- Background Jobs ---
+job_store: Optional[JobStore] = None
+job_workers: Optional[JobWorkerPool] = None
+
+async def _run_job_async(job: Dict[str, Any]) -> Any:
+    """Processes a queued job's file, recording progress in the job store."""
+    async def report_progress(progress: Dict[str, Any]) -> None:
+        await asyncio.to_thread(job_store.update_progress, job["id"], progress)
+
+    file_path = job["file_path"]
+    options = job["options"]
+    try:
+        result = await _process_file_async(
+            file_path,
+            options.get("file_ext", ""),
+            extraction_mode=options.get("extraction_mode"),
+            pdf_backend=options.get("pdf_backend"),
+            progress_callback=report_progress,
+            content_hash=options.get("content_hash"),
+        )
+    except asyncio.CancelledError:
+        raise # The job is re-queued and still needs its file.
+    except Exception:
+        Path(file_path).unlink(missing_ok=True)
+        raise
+    Path(file_path).unlink(missing_ok=True)
+    return jsonable_encoder(result)
+
 # --- API Endpoint ---
 @app.post("/process_document_v2/", summary="Upload and process a large document asynchronously")
-async def process_document_v2(file: UploadFile = File(...)):
+async def process_document_v2(
+    file: UploadFile = File(...),
+    extraction_mode: Optional[ExtractionMode] = None,
+    pdf_backend: Optional[str] = None,
+):
     """
     Handles large document processing by:
-    1. Reading the file into memory asynchronously.
-    2. Using a DocumentProcessor to orchestrate classification and chunked extraction.
+    1. Spooling the upload to disk and streaming its text page by page.
+    2. Using a DocumentProcessor to orchestrate classification and chunked extraction
+       while the remaining pages are still being parsed.
     3. Returning the final, merged, and validated structured data.
+
+    `extraction_mode` overrides the EXTRACTION_MODE setting and `pdf_backend`
+    the PDF_BACKEND setting for this request.
     """
     _, file_ext = os.path.splitext(file.filename)
 
+    file_path = None
     try:
-        file_bytes = await file.read()
-        content = await read_file_from_memory_async(file_bytes, file_ext)
-
-        processor = DocumentProcessor(content)
-        result = await processor.run_async()
-        
-        return result
+        file_path, content_hash = await _spool_upload_async(file, file_ext)
+        return await _process_file_async(
+            file_path, file_ext, extraction_mode, pdf_backend, content_hash=content_hash
+        )
+    except Exception as e:
+        status_code, detail = _error_status(e)
+        raise HTTPException(status_code=status_code, detail=detail)
+    finally:
+        if file_path is not None:
+            os.unlink(file_path)
 
-    except HTTPException as http_exc:
-        raise http_exc
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
+@app.post("/process_documents_batch/", summary="Process many documents and stream the results as NDJSON")
+async def process_documents_batch(
+    files: List[UploadFile] = File(...),
+    extraction_mode: Optional[ExtractionMode] = None,
+    pdf_backend: Optional[str] = None,
+):
+    """
+    Accepts several files and/or zip archives of files and streams one JSON line
+    per document as soon as it is done: {"filename", "status", "result"} on
+    success, {"filename", "status", "status_code", "error"} on failure.
+    Up to BATCH_MAX_CONCURRENT_DOCUMENTS documents are processed at once, and
+    all of their LLM calls share the process-wide request budget.
+    """
+    batch_dir = tempfile.mkdtemp(prefix="batch-")
+    try:
+        documents = await _spool_batch_async(files, batch_dir)
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-        raise HTTPException(status_code=500, detail=f"An internal error occurred while processing the file.")
\ No newline at end of file
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        status_code, detail = _error_status(e)
+        raise HTTPException(status_code=status_code, detail=detail)
+    return StreamingResponse(
+        _iter_batch_results_async(documents, batch_dir, extraction_mode, pdf_backend),
+        media_type="application/x-ndjson",
+    )
+
+@app.post("/jobs", status_code=202, summary="Queue a document for background processing")
+async def create_job(
+    file: UploadFile = File(...),
+    extraction_mode: Optional[ExtractionMode] = None,
+    pdf_backend: Optional[str] = None,
+):
+    """
+    Spools the upload to JOBS_DIR and queues it for one of the JOB_WORKERS
+    background workers. Poll GET /jobs/{job_id} for progress and fetch the
+    output from GET /jobs/{job_id}/result.
+    """
+    _, file_ext = os.path.splitext(file.filename)
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    job_id = JobStore.new_job_id()
+    file_path, content_hash = await _spool_upload_async(file, file_ext, directory=JOBS_DIR)
+    options = {
+        "file_ext": file_ext, "extraction_mode": extraction_mode, "pdf_backend": pdf_backend,
+        "content_hash": content_hash,
+    }
+    try:
+        await asyncio.to_thread(job_store.create, job_id, file.filename, file_path, options)
+    except BaseException:
+        os.unlink(file_path)
+        raise
+    job_workers.notify()
+    return {"job_id": job_id, "status": "queued"}
+
+async def _get_job_async(job_id: str) -> Dict[str, Any]:
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    return job
+
+@app.get("/jobs/{job_id}", summary="Status and progress of a background job")
+async def get_job(job_id: str):
+    job = await _get_job_async(job_id)
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "filename": job["filename"],
+        "progress": job["progress"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+
+@app.get("/jobs/{job_id}/result", summary="Result of a finished background job")
+async def get_job_result(job_id: str):
+    """Returns the job's output, 409 while it is still pending, or the error it failed with."""
+    job = await _get_job_async(job_id)
+    if job["status"] == "failed":
+        raise HTTPException(status_code=job["error_status"] or 500, detail=job["error"])
+    if job["status"] != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job '{job_id}' is still {job['status']}.")
+    return job["result"]
+
+@app.get("/metrics", response_class=PlainTextResponse, summary="Metrics in the Prometheus text format")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/stats/llm_pool", summary="Connection pool statistics of the shared LLM client")
+async def llm_pool_stats():
+    return get_llm_pool_stats()
+
+@app.get("/stats/llm_cache", summary="Hit/miss statistics of the LLM response cache")
+async def llm_cache_stats():
+    return get_llm_cache_stats()
+
+@app.get("/stats/rate_limiter", summary="Buckets and adaptive concurrency limit of the LLM rate limiter")
+async def rate_limiter_stats():
+    return get_rate_limiter_stats()
+
+@app.get("/stats/document_cache", summary="Size and hit/miss statistics of the whole-document result cache")
+async def document_cache_stats():
+    if document_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **await asyncio.to_thread(document_cache.stats)}
+
+@app.get("/stats/chunk_store", summary="Size and hit/miss statistics of the chunk result store")
+async def chunk_store_stats():
+    if chunk_store is None:
+        return {"enabled": False}
+    return {"enabled": True, **await asyncio.to_thread(chunk_store.stats)}
+
+@app.delete("/cache/documents", summary="Invalidate cached document results")
+async def invalidate_document_cache(content_hash: Optional[str] = None):
+    """Drops the cached results of one upload (by its content hash), or all of them."""
+    if document_cache is None:
+        raise HTTPException(status_code=404, detail="The document cache is disabled.")
+    return {"deleted": await document_cache.invalidate(content_hash)}
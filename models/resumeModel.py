@@ -3,6 +3,9 @@ from typing import List, Optional
 from pydantic import BaseModel, EmailStr, HttpUrl, Field
 from datetime import date, datetime
 
+# AwardItem has a field named 'date', which shadows the type inside its class body.
+Date = date
+
 
 class Location(BaseModel):
     address: Optional[str] = Field(None, description="To add multiple address lines, use \n. For example, 1234 Glücklichkeit Straße\nHinterhaus 5. Etage li.")
@@ -65,7 +68,7 @@ class EducationItem(BaseModel):
 
 class AwardItem(BaseModel):
     title: Optional[str] = Field(None, description="e.g. One of the 100 greatest minds of the century")
-    date: Optional[date] = None
+    date: Optional[Date] = None
     awarder: Optional[str] = Field(None, description="e.g. Time Magazine")
     summary: Optional[str] = Field(None, description="e.g. Received for my work with Quantum Physics")
 
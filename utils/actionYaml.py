@@ -0,0 +1,99 @@
+import re
+from typing import Any, Dict, Iterator, Tuple, Type
+
+import yaml
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+from models.githubActionModel import GitHubAction, RunsComposite, RunsDocker, RunsJavascript
+
+FENCED_BLOCK = re.compile(r"```[ \t]*([\w-]*)[^\n]*\n(.*?)```", re.DOTALL)
+# Start of a plain action.yml-style document: a top-level action key.
+TOP_LEVEL_KEY = re.compile(r"(?m)^(name|description|author|inputs|outputs|runs|branding):")
+# Keys that mark a workflow file (e.g. a usage example) rather than action metadata.
+# PyYAML reads a bare `on:` key as True.
+WORKFLOW_KEYS = {"jobs", "on", True}
+ACTION_KEYS = {"name", "description", "author", "inputs", "outputs", "runs", "branding"}
+RUNS_MODELS: Dict[str, Type[BaseModel]] = {"composite": RunsComposite, "docker": RunsDocker}
+
+_field_adapters: Dict[str, TypeAdapter] = {}
+
+
+def _iter_candidates(text: str) -> Iterator[str]:
+    """Yields fenced code blocks (YAML or unlabelled), then the text from its first top-level action key."""
+    for match in FENCED_BLOCK.finditer(text):
+        if match.group(1).lower() in ("", "yaml", "yml"):
+            yield match.group(2)
+    start = TOP_LEVEL_KEY.search(text)
+    if start:
+        yield text[start.start():]
+
+
+def _load_mapping(candidate: str) -> Dict[Any, Any]:
+    """Parses a candidate, dropping trailing non-YAML lines (e.g. README prose) if needed."""
+    lines = candidate.splitlines()
+    while lines:
+        try:
+            loaded = yaml.safe_load("\n".join(lines))
+            return loaded if isinstance(loaded, dict) else {}
+        except yaml.YAMLError as e:
+            mark = getattr(e, "problem_mark", None)
+            if mark is None or mark.line == 0 or mark.line >= len(lines):
+                return {}
+            lines = lines[:mark.line]
+    return {}
+
+
+def _normalize_inputs(inputs: Any) -> Any:
+    """YAML types input defaults (e.g. `default: 1`), but the schema stores them as strings."""
+    if not isinstance(inputs, dict):
+        return inputs
+    for spec in inputs.values():
+        if isinstance(spec, dict) and spec.get("default") is not None and not isinstance(spec["default"], str):
+            default = spec["default"]
+            spec["default"] = str(default).lower() if isinstance(default, bool) else str(default)
+    return inputs
+
+
+def _validate_field(name: str, value: Any) -> bool:
+    """Checks one top-level field against GitHubAction (and the Runs model its `using` selects)."""
+    try:
+        if name == "runs":
+            using = value.get("using") if isinstance(value, dict) else None
+            model = RUNS_MODELS.get(using, RunsJavascript)
+            model.model_validate(value)
+        else:
+            if name not in _field_adapters:
+                _field_adapters[name] = TypeAdapter(GitHubAction.model_fields[name].annotation)
+            _field_adapters[name].validate_python(value)
+        return True
+    except ValidationError:
+        return False
+
+
+def extract_action_yaml(text: str) -> Tuple[Dict[str, Any], bool]:
+    """
+    Fills GitHubAction fields from YAML found in a chunk: fenced ```yaml blocks
+    or a plain action.yml. Workflow examples are ignored, and every field is
+    validated before it is used. Returns the fields found and whether they
+    form a complete, valid GitHubAction, in which case no LLM call is needed.
+    """
+    found: Dict[str, Any] = {}
+    for candidate in _iter_candidates(text):
+        mapping = _load_mapping(candidate)
+        if not mapping or WORKFLOW_KEYS & mapping.keys() or not (ACTION_KEYS & mapping.keys()):
+            continue
+        for name in ACTION_KEYS & mapping.keys():
+            value = mapping[name]
+            if name == "inputs":
+                value = _normalize_inputs(value)
+            if name not in found and value is not None and _validate_field(name, value):
+                found[name] = value
+
+    if not found:
+        return found, False
+    try:
+        GitHubAction.model_validate(found)
+        return found, True
+    except ValidationError:
+        return found, False
+
@@ -0,0 +1,318 @@
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+
+class LRUCache:
+    """An in-memory string cache with least-recently-used eviction and a TTL."""
+    def __init__(self, max_entries: int, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if self.ttl_seconds is not None and time.time() - stored_at > self.ttl_seconds:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str, stored_at: Optional[float] = None) -> None:
+        self._entries[key] = (stored_at or time.time(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """
+    An on-disk string cache backed by a single SQLite table.
+    Entries expire after the TTL and the least recently read ones are evicted
+    once the table holds more than `max_entries` rows or, if `max_bytes` is
+    set, once the stored values add up to more than `max_bytes`. A non-zero
+    `mmap_size` lets SQLite read the database through a memory map of that size.
+    """
+    def __init__(
+        self,
+        path: str,
+        max_entries: int,
+        ttl_seconds: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        mmap_size: int = 0,
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        if mmap_size:
+            self._conn.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+
+    def get(self, key: str) -> Optional[Tuple[float, str]]:
+        """Returns (stored_at, value) or None."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, stored_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, stored_at = row
+            if self.ttl_seconds is not None and now - stored_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return stored_at, value
+
+    def set(self, key: str, value: str) -> None:
+        self.set_many({key: value})
+
+    def set_many(self, items: Dict[str, str]) -> None:
+        """Stores several entries in one transaction, evicting once afterwards."""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO cache (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    [(key, value, now, now) for key, value in items.items()],
+                )
+                self._evict()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self) -> None:
+        if self.ttl_seconds is not None:
+            self._conn.execute("DELETE FROM cache WHERE stored_at < ?", (time.time() - self.ttl_seconds,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,),
+            )
+        if self.max_bytes is not None:
+            (total,) = self._conn.execute(
+                "SELECT COALESCE(SUM(LENGTH(CAST(value AS BLOB))), 0) FROM cache"
+            ).fetchone()
+            excess = total - self.max_bytes
+            if excess <= 0:
+                return
+            evicted = []
+            for key, size in self._conn.execute(
+                "SELECT key, LENGTH(CAST(value AS BLOB)) FROM cache ORDER BY accessed_at"
+            ):
+                evicted.append((key,))
+                excess -= size
+                if excess <= 0:
+                    break
+            self._conn.executemany("DELETE FROM cache WHERE key = ?", evicted)
+
+    def delete_prefix(self, prefix: str) -> int:
+        """Deletes every entry whose key starts with `prefix` and returns how many there were."""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+        return cursor.rowcount
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            (total,) = self._conn.execute(
+                "SELECT COALESCE(SUM(LENGTH(CAST(value AS BLOB))), 0) FROM cache"
+            ).fetchone()
+        return total
+
+    def clear(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM cache")
+        return cursor.rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+        return count
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class LLMResponseCache:
+    """
+    Content-addressed cache for LLM responses.
+    Looks in the in-memory LRU tier first and falls back to the optional SQLite
+    tier; disk hits are promoted to memory. Disk access runs in a worker thread
+    so it never blocks the event loop.
+    """
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: Optional[float] = None,
+        db_path: Optional[str] = None,
+        disk_max_entries: int = 100_000,
+    ):
+        self.memory = LRUCache(max_entries, ttl_seconds)
+        self.disk = SQLiteCache(db_path, disk_max_entries, ttl_seconds) if db_path else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model_name: str, system_message: str, prompt: str) -> str:
+        digest = hashlib.sha256()
+        for part in (model_name, system_message, prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+        if self.disk is not None:
+            entry = await asyncio.to_thread(self.disk.get, key)
+            if entry is not None:
+                stored_at, value = entry
+                self.memory.set(key, value, stored_at=stored_at)
+                self.disk_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str) -> None:
+        self.memory.set(key, value)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_entries": len(self.memory),
+            "disk_entries": len(self.disk) if self.disk is not None else None,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+
+class DocumentResultCache:
+    """
+    End-to-end cache of document processing results on local disk.
+    Keys combine the hash of the uploaded bytes with a pipeline version (model,
+    prompts, schemas and options), so a hit can be returned before the file is
+    even parsed. The store is bounded in bytes; least recently read results go first.
+    """
+    def __init__(self, db_path: str, max_bytes: int, ttl_seconds: Optional[float] = None):
+        self.disk = SQLiteCache(db_path, max_entries=1_000_000, ttl_seconds=ttl_seconds, max_bytes=max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(content_hash: str, pipeline_version: str) -> str:
+        return f"{content_hash}:{pipeline_version}"
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = await asyncio.to_thread(self.disk.get, key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(entry[1])
+
+    async def set(self, key: str, result: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self.disk.set, key, json.dumps(result))
+
+    async def invalidate(self, content_hash: Optional[str] = None) -> int:
+        """Drops the results for one upload (every pipeline version), or all results."""
+        if content_hash is None:
+            return await asyncio.to_thread(self.disk.clear)
+        return await asyncio.to_thread(self.disk.delete_prefix, f"{content_hash}:")
+
+    def close(self) -> None:
+        self.disk.close()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.disk),
+            "size_bytes": self.disk.size_bytes(),
+            "max_bytes": self.disk.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class ChunkResultStore(DocumentResultCache):
+    """
+    Memoized stateless extraction output of single chunks, on local disk.
+    Keys combine the chunk's hash with the document type and a hash of the
+    schema and prompt it was extracted with, so an edited document only sends
+    its new or changed chunks to the LLM.
+    """
+    @staticmethod
+    def make_key(chunk_hash: str, doc_type: str, schema_hash: str) -> str:
+        return f"{chunk_hash}:{doc_type}:{schema_hash}"
+
+
+class PageTextCache:
+    """
+    Cache of the text extracted from single PDF pages, on local disk.
+    Keys combine a hash of the page's content stream with the parser settings,
+    so an edited PDF only has its changed pages parsed again. It is used from
+    the PDF worker processes, which share the SQLite file; reads go through a
+    memory map and the least recently read pages are evicted past `max_bytes`.
+    """
+    def __init__(self, db_path: str, max_bytes: int, mmap_size: int = 0):
+        self.disk = SQLiteCache(db_path, max_entries=10_000_000, max_bytes=max_bytes, mmap_size=mmap_size)
+
+    @staticmethod
+    def make_key(page_hash: str, parser: str) -> str:
+        return f"{page_hash}:{parser}"
+
+    def get_many(self, keys: Dict[int, str]) -> Dict[int, str]:
+        """Looks up page number -> key and returns the texts found, by page number."""
+        texts: Dict[int, str] = {}
+        for page_number, key in keys.items():
+            entry = self.disk.get(key)
+            if entry is not None:
+                texts[page_number] = entry[1]
+        return texts
+
+    def set_many(self, texts: Dict[str, str]) -> None:
+        self.disk.set_many(texts)
+
+    def close(self) -> None:
+        self.disk.close()
@@ -0,0 +1,173 @@
+import hashlib
+import logging
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+import tiktoken
+from langchain.text_splitter import RecursiveCharacterTextSplitter, TextSplitter
+
+logger = logging.getLogger(__name__)
+
+
+async def iter_chunks_async(
+    text_stream: AsyncIterator[str], splitter: TextSplitter, min_buffer_chars: int
+) -> AsyncIterator[str]:
+    """
+    Splits a stream of text into chunks as the text arrives.
+    Text is buffered until at least `min_buffer_chars` are available. Every chunk
+    but the last is then emitted, and the last one (which already starts with the
+    overlap of the chunk before it) becomes the start of the next buffer. Memory
+    is therefore bounded by the buffer, not by the document size.
+    """
+    buffer = ""
+    async for text in text_stream:
+        buffer += text
+        if len(buffer) < min_buffer_chars:
+            continue
+        chunks = splitter.split_text(buffer)
+        if len(chunks) < 2:
+            continue
+        for chunk in chunks[:-1]:
+            yield chunk
+        buffer = chunks[-1]
+
+    for chunk in splitter.split_text(buffer):
+        yield chunk
+
+
+class _ContentDefinedChunker:
+    """
+    Packs lines into chunks that end at content-defined cut points: a line is a
+    cut point if its hash is divisible by `cut_divisor`. Once a chunk holds
+    `min_tokens`, it ends at the next cut point (or when it would exceed
+    `max_tokens`). An edit therefore only changes the chunks around it; the
+    boundaries after it fall on the same lines as before.
+    """
+    def __init__(
+        self,
+        splitter: TextSplitter,
+        count_tokens: Callable[[str], int],
+        max_tokens: int,
+        min_tokens: int,
+        cut_divisor: int,
+    ):
+        self.splitter = splitter
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+        self.cut_divisor = cut_divisor
+        self._lines: List[str] = []
+        self._tokens = 0
+
+    def _is_cut_point(self, line: str) -> bool:
+        stripped = line.strip()
+        if not stripped:
+            return False
+        digest = hashlib.blake2b(stripped.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big") % self.cut_divisor == 0
+
+    def add(self, line: str) -> List[str]:
+        """Adds one line (with its line break) and returns the chunks it completes."""
+        tokens = self.count_tokens(line)
+        if tokens > self.max_tokens:
+            # A line longer than a chunk (e.g. text without line breaks) is split on its own.
+            return self.finish() + self.splitter.split_text(line)
+        chunks = self.finish() if self._tokens + tokens > self.max_tokens else []
+        self._lines.append(line)
+        self._tokens += tokens
+        if self._tokens >= self.min_tokens and self._is_cut_point(line):
+            chunks += self.finish()
+        return chunks
+
+    def finish(self) -> List[str]:
+        """Returns the pending lines as a chunk, if they hold any text."""
+        chunk = "".join(self._lines)
+        self._lines = []
+        self._tokens = 0
+        return [chunk] if chunk.strip() else []
+
+
+async def iter_content_defined_chunks_async(
+    text_stream: AsyncIterator[str],
+    splitter: TextSplitter,
+    count_tokens: Callable[[str], int],
+    max_tokens: int,
+    cut_divisor: int = 32,
+) -> AsyncIterator[str]:
+    """
+    Splits a stream of text into chunks whose boundaries depend on the content
+    instead of on the position (see _ContentDefinedChunker), so an edited
+    document shares every chunk away from the edit with the previous version.
+    Chunks hold between half of `max_tokens` and `max_tokens` and do not overlap.
+    `splitter` is only used for single lines longer than `max_tokens`.
+    """
+    chunker = _ContentDefinedChunker(splitter, count_tokens, max_tokens, max(1, max_tokens // 2), cut_divisor)
+    pending = ""
+    async for text in text_stream:
+        lines = (pending + text).splitlines(keepends=True)
+        pending = lines.pop() if lines and not lines[-1].endswith(("\n", "\r")) else ""
+        for line in lines:
+            for chunk in chunker.add(line):
+                yield chunk
+    if pending:
+        for chunk in chunker.add(pending):
+            yield chunk
+    for chunk in chunker.finish():
+        yield chunk
+
+
+class ChunkPlanner:
+    """
+    Sizes chunks in tokens instead of characters.
+    A chunk gets whatever the model's context window leaves after the rendered
+    prompt (schema, rules, instructions) and the reserved response tokens, so a
+    document is split into the fewest chunks that still fit in one call.
+    Tokens are counted with tiktoken; if no encoding can be loaded, a
+    conservative characters-per-token estimate is used instead.
+    """
+    CHARS_PER_TOKEN_ESTIMATE = 3
+
+    def __init__(
+        self,
+        context_tokens: int,
+        response_tokens: int,
+        overlap_tokens: int,
+        max_chunk_tokens: Optional[int] = None,
+        min_chunk_tokens: int = 256,
+        encoding_name: str = "cl100k_base",
+    ):
+        self.context_tokens = context_tokens
+        self.response_tokens = response_tokens
+        self.overlap_tokens = overlap_tokens
+        self.max_chunk_tokens = max_chunk_tokens
+        self.min_chunk_tokens = min_chunk_tokens
+        try:
+            self._encoding = tiktoken.get_encoding(encoding_name)
+        except Exception as e:
+            logger.warning("Tokenizer '%s' unavailable (%s); estimating token counts.", encoding_name, e)
+            self._encoding = None
+
+    def count_tokens(self, text: str) -> int:
+        if self._encoding is None:
+            return -(-len(text) // self.CHARS_PER_TOKEN_ESTIMATE)
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def chunk_budget(self, prompt_overhead: str) -> int:
+        """Tokens left for document content once the prompt and response are accounted for."""
+        budget = self.context_tokens - self.response_tokens - self.count_tokens(prompt_overhead)
+        if self.max_chunk_tokens:
+            budget = min(budget, self.max_chunk_tokens)
+        return max(budget, self.min_chunk_tokens)
+
+    def make_splitter(self, prompt_overhead: str) -> Tuple[TextSplitter, int]:
+        """
+        Returns a splitter that packs chunks up to the budget for this prompt,
+        and the number of characters worth buffering before each split.
+        """
+        budget = self.chunk_budget(prompt_overhead)
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=budget,
+            chunk_overlap=min(self.overlap_tokens, budget // 2),
+            length_function=self.count_tokens,
+        )
+        # Roughly two to three chunks of typical text.
+        return splitter, 3 * budget * self.CHARS_PER_TOKEN_ESTIMATE
@@ -0,0 +1,72 @@
+import copy
+import json
+from typing import Any, Dict, List, Tuple, Union
+
+JsonPath = Tuple[Union[str, int], ...]
+
+# Anchor of errors that cannot be fixed locally (model-level validators, missing
+# top-level fields): the whole document has to be corrected.
+ROOT: JsonPath = ()
+
+
+def error_anchor(data: Any, loc: JsonPath) -> JsonPath:
+    """
+    Returns the part of the data an error should be fixed in: its location up
+    to and including the first list index, or else its top-level field. Errors
+    whose top-level field does not exist in the data are anchored at ROOT.
+    """
+    path: List[Union[str, int]] = []
+    node = data
+    for element in loc:
+        if isinstance(node, list) and isinstance(element, int) and 0 <= element < len(node):
+            path.append(element)
+            return tuple(path)
+        if isinstance(node, dict) and element in node:
+            path.append(element)
+            node = node[element]
+            continue
+        break # A missing field, or one of pydantic's union tags such as 'composite'.
+    return tuple(path[:1])
+
+
+def group_errors(data: Any, errors: List[Dict[str, Any]]) -> Dict[JsonPath, List[Dict[str, Any]]]:
+    """Groups pydantic's ValidationError.errors() by anchor (see error_anchor)."""
+    groups: Dict[JsonPath, List[Dict[str, Any]]] = {}
+    for error in errors:
+        groups.setdefault(error_anchor(data, tuple(error["loc"])), []).append(error)
+    # Anchors nested in another anchor are fixed together with it.
+    for anchor in sorted(groups, key=len):
+        if anchor not in groups:
+            continue
+        for other in [a for a in groups if a != anchor and a[:len(anchor)] == anchor]:
+            groups[anchor].extend(groups.pop(other))
+    return groups
+
+
+def get_at(data: Any, path: JsonPath) -> Any:
+    for element in path:
+        data = data[element]
+    return data
+
+
+def set_at(data: Any, path: JsonPath, value: Any) -> Any:
+    """Returns a copy of `data` with the value at `path` replaced."""
+    if not path:
+        return value
+    data = copy.copy(data)
+    data[path[0]] = set_at(data[path[0]], path[1:], value)
+    return data
+
+
+def format_errors(errors: List[Dict[str, Any]], anchor: JsonPath, max_input_chars: int = 200) -> str:
+    """Renders errors with locations relative to `anchor`, one per line."""
+    lines = []
+    for error in errors:
+        loc = tuple(error["loc"])
+        relative = loc[len(anchor):] if loc[:len(anchor)] == anchor else loc
+        location = ".".join(str(element) for element in relative) or "(this object)"
+        value = json.dumps(error.get("input"), default=str)
+        if len(value) > max_input_chars:
+            value = value[:max_input_chars] + "..."
+        lines.append(f"- {location}: {error['msg']} (input: {value})")
+    return "\n".join(lines)
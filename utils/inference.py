@@ -1,38 +1,320 @@
 import os
-from openai import AsyncOpenAI # Import the asynchronous client
+import json
+import time
+import asyncio
+import logging
+import importlib.util
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, RateLimitError # Import the asynchronous client
 from dotenv import load_dotenv
+
+from utils.cache import LLMResponseCache
+from utils.metrics import LLM_CALL_TOKENS, LLM_INFERENCE_SECONDS, LLM_REQUEST_SECONDS, LLM_TOKENS, record_cache_lookup
+from utils.rateLimiter import RateLimiter, estimate_tokens, parse_retry_after
+from utils.retry import LatencyTracker, backoff_delay, hedged_async, is_retryable
 load_dotenv()
 
-def get_async_llm_client():
-    """Initializes and returns the Asynchronous OpenAI client."""
+logger = logging.getLogger(__name__)
+
+# --- Connection Pool Configuration ---
+LLM_BASE_URL = "https://api.groq.com/openai/v1"
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() == "true"
+
+# --- Global Request Budget ---
+# Shared by every document being processed, so concurrent requests and batches
+# together never exceed the provider's limits. See utils.rateLimiter.
+LLM_MAX_CONCURRENT_REQUESTS = int(os.getenv("LLM_MAX_CONCURRENT_REQUESTS", "16"))
+LLM_MIN_CONCURRENT_REQUESTS = int(os.getenv("LLM_MIN_CONCURRENT_REQUESTS", "1"))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))  # 0 disables the request bucket
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))  # 0 disables the token bucket
+LLM_EXPECTED_COMPLETION_TOKENS = int(os.getenv("LLM_EXPECTED_COMPLETION_TOKENS", "1024"))
+LLM_RATE_LIMIT_HEADROOM = float(os.getenv("LLM_RATE_LIMIT_HEADROOM", "0.95"))
+
+rate_limiter = RateLimiter(
+    requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+    tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+    max_concurrency=LLM_MAX_CONCURRENT_REQUESTS,
+    min_concurrency=LLM_MIN_CONCURRENT_REQUESTS,
+    headroom=LLM_RATE_LIMIT_HEADROOM,
+)
+
+# --- Timeouts, Retries and Hedging ---
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))  # seconds per API call
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+# A duplicate call is started once the first has run longer than the recent p95 latency.
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "false").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+# --- Response Cache Configuration ---
+SYSTEM_MESSAGE = "You are a helpful assistant designed to output JSON."
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048"))
+LLM_CACHE_DB_PATH = os.getenv("LLM_CACHE_DB_PATH", "")  # empty disables the on-disk tier
+LLM_CACHE_DISK_MAX_ENTRIES = int(os.getenv("LLM_CACHE_DISK_MAX_ENTRIES", "100000"))
+
+response_cache = LLMResponseCache(
+    max_entries=LLM_CACHE_MAX_ENTRIES,
+    ttl_seconds=LLM_CACHE_TTL,
+    db_path=LLM_CACHE_DB_PATH or None,
+    disk_max_entries=LLM_CACHE_DISK_MAX_ENTRIES,
+) if LLM_CACHE_ENABLED else None
+
+# One client (and therefore one connection pool) per process.
+_async_client: Optional[AsyncOpenAI] = None
+_http_client: Optional[httpx.AsyncClient] = None
+_requests_sent = 0
+_latencies = LatencyTracker()
+_call_stats = {"retries": 0, "timeouts": 0, "hedges_sent": 0, "hedges_won": 0}
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional 'h2' package (pip install 'httpx[http2]')."""
+    return LLM_HTTP2 and importlib.util.find_spec("h2") is not None
+
+
+def init_async_llm_client() -> AsyncOpenAI:
+    """
+    Creates the process-wide Asynchronous OpenAI client if it does not exist yet.
+    The client keeps its connections alive, so chunks after the first one reuse
+    an open socket instead of paying for a new TLS handshake.
+    """
+    global _async_client, _http_client
+    if _async_client is not None:
+        return _async_client
+
     # Using GROQ as per your original code
     api_key = os.getenv("GROQ_API_KEY")
     if not api_key:
         raise ValueError("GROQ_API_KEY environment variable not set.")
-    return AsyncOpenAI(api_key=api_key, base_url="https://api.groq.com/openai/v1")
+
+    _http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+        http2=_http2_available(),
+    )
+    # Retries are handled by run_inference_async so the rate limiter sees every 429.
+    _async_client = AsyncOpenAI(api_key=api_key, base_url=LLM_BASE_URL, http_client=_http_client, max_retries=0)
+    return _async_client
+
+
+def get_async_llm_client() -> AsyncOpenAI:
+    """Returns the shared Asynchronous OpenAI client, creating it on first use."""
+    return init_async_llm_client()
+
+
+async def close_async_llm_client() -> None:
+    """Closes the shared client and its pooled connections. Called on app shutdown."""
+    global _async_client, _http_client
+    if _async_client is not None:
+        await _async_client.close()
+    if _http_client is not None:
+        await _http_client.aclose()
+    _async_client = None
+    _http_client = None
+
+
+def get_llm_pool_stats() -> Dict[str, Any]:
+    """Reports the pool configuration and the state of its open connections."""
+    stats: Dict[str, Any] = {
+        "initialized": _async_client is not None,
+        "http2": _http2_available(),
+        "max_connections": LLM_MAX_CONNECTIONS,
+        "max_keepalive_connections": LLM_MAX_KEEPALIVE_CONNECTIONS,
+        "keepalive_expiry": LLM_KEEPALIVE_EXPIRY,
+        "requests_sent": _requests_sent,
+        "requests_in_flight": rate_limiter.concurrency.in_flight,
+        **_call_stats,
+        "latency_p50": _latencies.percentile(0.5),
+        "latency_p95": _latencies.percentile(0.95),
+        "connections": 0,
+        "idle_connections": 0,
+        "active_connections": 0,
+    }
+    # httpx does not expose pool state publicly; read it from the httpcore pool if present.
+    pool = getattr(getattr(_http_client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", []))
+    idle = sum(1 for conn in connections if conn.is_idle())
+    stats.update(
+        connections=len(connections),
+        idle_connections=idle,
+        active_connections=len(connections) - idle,
+    )
+    return stats
 
 
-async def run_inference_async(prompt: str, model_name: str) -> str:
+def get_llm_cache_stats() -> Dict[str, Any]:
+    """Reports hit/miss counters and sizes of the LLM response cache."""
+    if response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **response_cache.stats()}
+
+
+def get_rate_limiter_stats() -> Dict[str, Any]:
+    """Reports the buckets and the adaptive concurrency limit of the LLM rate limiter."""
+    return rate_limiter.stats()
+
+
+class TruncatedResponseError(Exception):
+    """The model stopped at the max_tokens limit, so its answer is incomplete."""
+
+
+async def _call_llm_async(
+    prompt: str, model_name: str, max_tokens: Optional[int] = None, admitted: Optional[asyncio.Event] = None
+) -> str:
     """
-    Runs a prompt against the specified model asynchronously using AsyncOpenAI.
-    Instructs the model to return a JSON object.
+    One API call: admitted by the rate limiter and bounded by LLM_TIMEOUT.
+    Sets `admitted` once the rate limiter lets the call through. Raises
+    TruncatedResponseError if the answer was cut off at `max_tokens`.
     """
+    global _requests_sent
     client = get_async_llm_client()
-    print(f"Running async inference with model: {model_name}...")
+    # Providers may count max_tokens against the token quota, so it is reserved in full when set.
+    completion_tokens = max_tokens if max_tokens is not None else LLM_EXPECTED_COMPLETION_TOKENS
+    estimated_tokens = estimate_tokens(SYSTEM_MESSAGE + prompt, completion_tokens)
+    started_at = await rate_limiter.acquire(estimated_tokens)
+    if admitted is not None:
+        admitted.set()
+    call_started = time.perf_counter()
+    outcome = "error"
     try:
         # Use 'await' for the non-blocking API call
-        response = await client.chat.completions.create(
-            model=model_name,
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant designed to output JSON."},
-                {"role": "user", "content": prompt},
-            ],
+        _requests_sent += 1
+        response = await asyncio.wait_for(
+            client.chat.completions.create(
+                model=model_name,
+                response_format={"type": "json_object"},
+                messages=[
+                    {"role": "system", "content": SYSTEM_MESSAGE},
+                    {"role": "user", "content": prompt},
+                ],
+                max_tokens=max_tokens,
+                timeout=LLM_TIMEOUT,
+            ),
+            timeout=LLM_TIMEOUT,
         )
-        content = response.choices[0].message.content
-        if not content:
-            raise ValueError("Received an empty response from the model.")
-        return content
-    except Exception as e:
-        print(f"An error occurred during OpenAI API call: {e}")
-        raise
\ No newline at end of file
+    except RateLimitError as e:
+        outcome = "throttled"
+        rate_limiter.on_throttle(started_at, parse_retry_after(e.response.headers))
+        raise
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        _call_stats["timeouts"] += 1
+        raise
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    else:
+        outcome = "ok"
+        _latencies.record(time.perf_counter() - call_started)
+        usage = response.usage.total_tokens if response.usage else None
+        rate_limiter.on_success(estimated_tokens, usage)
+        if response.usage:
+            LLM_TOKENS.inc(response.usage.prompt_tokens, kind="prompt")
+            LLM_TOKENS.inc(response.usage.completion_tokens, kind="completion")
+            LLM_CALL_TOKENS.observe(response.usage.total_tokens)
+    finally:
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - call_started, outcome=outcome)
+        await rate_limiter.release()
+    choice = response.choices[0]
+    if choice.finish_reason == "length":
+        raise TruncatedResponseError(f"The response was cut off at {max_tokens} tokens.")
+    content = choice.message.content
+    if not content:
+        raise ValueError("Received an empty response from the model.")
+    return content
+
+
+def _hedge_delay() -> Optional[float]:
+    """The latency after which a hedge is sent, once enough calls have been observed."""
+    if not LLM_HEDGING_ENABLED or len(_latencies) < LLM_HEDGE_MIN_SAMPLES:
+        return None
+    return _latencies.percentile(LLM_HEDGE_PERCENTILE)
+
+
+def _count_hedge() -> None:
+    _call_stats["hedges_sent"] += 1
+
+
+def is_json_object(content: str) -> bool:
+    try:
+        return isinstance(json.loads(content), dict)
+    except json.JSONDecodeError:
+        return False
+
+
+async def run_inference_async(
+    prompt: str,
+    model_name: str,
+    use_cache: bool = True,
+    accept: Callable[[str], bool] = is_json_object,
+    max_tokens: Optional[int] = None,
+) -> str:
+    """
+    Runs a prompt against the specified model asynchronously using AsyncOpenAI.
+    Instructs the model to return a JSON object.
+    Identical (model, system message, prompt) requests are answered from the
+    response cache without calling the API unless `use_cache` is False. Only
+    responses that `accept` approves (by default: a JSON object) are cached,
+    so a bad answer is not replayed to every later caller.
+    The answer is limited to `max_tokens`; one cut off at the limit raises
+    TruncatedResponseError and is neither retried nor cached.
+    API calls are admitted by the process-wide rate limiter, time out after
+    LLM_TIMEOUT seconds and are retried with jittered exponential backoff on
+    throttling, timeouts, connection and server errors. With hedging enabled,
+    a slow call is raced against a duplicate started at the p95 latency.
+    """
+    started = time.perf_counter()
+    cache_key = None
+    if use_cache and response_cache is not None:
+        cache_key = LLMResponseCache.make_key(model_name, SYSTEM_MESSAGE, prompt)
+        cached = await response_cache.get(cache_key)
+        record_cache_lookup("llm", cached is not None)
+        if cached is not None:
+            LLM_INFERENCE_SECONDS.observe(time.perf_counter() - started, source="cache")
+            return cached
+
+    logger.debug("Running async inference with model: %s", model_name)
+    attempt = 0
+    while True:
+        hedge_after = _hedge_delay()
+        try:
+            content, hedged = await hedged_async(
+                lambda admitted: _call_llm_async(prompt, model_name, max_tokens, admitted),
+                hedge_after,
+                on_hedge=_count_hedge,
+                # A hedge doubles demand, so none is sent while calls wait for the rate limiter.
+                can_hedge=lambda: not rate_limiter.is_throttling(),
+            )
+            break
+        except Exception as e:
+            if not is_retryable(e) or attempt >= LLM_MAX_RETRIES:
+                if not isinstance(e, TruncatedResponseError): # The caller decides how to handle it.
+                    logger.error("An error occurred during the LLM API call: %r", e)
+                raise
+            retry_after = parse_retry_after(e.response.headers) if isinstance(e, RateLimitError) else None
+            delay = backoff_delay(attempt, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX, retry_after)
+            attempt += 1
+            _call_stats["retries"] += 1
+            logger.warning(
+                "Retrying LLM call in %.1fs (attempt %d/%d): %r", delay, attempt + 1, LLM_MAX_RETRIES + 1, e
+            )
+            await asyncio.sleep(delay)
+    if hedged:
+        _call_stats["hedges_won"] += 1
+    LLM_INFERENCE_SECONDS.observe(time.perf_counter() - started, source="api")
+
+    if cache_key is not None and accept(content):
+        await response_cache.set(cache_key, content)
+    return content
@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import sqlite3
+import asyncio
+import threading
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from utils.structuredLogger import log_context
+
+logger = logging.getLogger(__name__)
+
+
+class JobStore:
+    """
+    A persistent job queue in a local SQLite database.
+    Jobs move from 'queued' to 'running' to 'succeeded' or 'failed'. Because the
+    queue lives on disk, queued jobs survive a restart. A running job is leased
+    to the store that claimed it, which must renew the lease while it works;
+    jobs whose lease ran out (their process died) are put back in the queue, so
+    several processes can share one database without taking each other's jobs.
+    """
+    def __init__(self, path: str, lease_seconds: float = 60.0):
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, filename TEXT, file_path TEXT NOT NULL,"
+            " options TEXT NOT NULL, progress TEXT NOT NULL, result TEXT,"
+            " error TEXT, error_status INTEGER,"
+            " created_at REAL NOT NULL, updated_at REAL NOT NULL,"
+            " lease_owner TEXT, lease_expires_at REAL)"
+        )
+        # Databases created before leases existed lack the lease columns.
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, column_type in (("lease_owner", "TEXT"), ("lease_expires_at", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+
+    @staticmethod
+    def new_job_id() -> str:
+        return uuid.uuid4().hex
+
+    def create(self, job_id: str, filename: str, file_path: str, options: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, filename, file_path, options, progress, created_at, updated_at)"
+                " VALUES (?, 'queued', ?, ?, ?, '{}', ?, ?)",
+                (job_id, filename, file_path, json.dumps(options), now, now),
+            )
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """
+        Marks the oldest queued job as running, leased to this store, and
+        returns it, or None if the queue is empty.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    now = time.time()
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', lease_owner = ?, lease_expires_at = ?, updated_at = ?"
+                        " WHERE id = ?",
+                        (self.owner, now + self.lease_seconds, now, row["id"]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self._to_dict(row, status="running") if row is not None else None
+
+    def update_progress(self, job_id: str, progress: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(progress), time.time(), job_id),
+            )
+
+    def succeed(self, job_id: str, result: Any) -> None:
+        # Only the lease holder finishes a job; a job whose lease was lost has been re-queued.
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'succeeded', result = ?, lease_owner = NULL, lease_expires_at = NULL,"
+                " updated_at = ? WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                (json.dumps(result), time.time(), job_id, self.owner),
+            )
+
+    def fail(self, job_id: str, error: str, error_status: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, error_status = ?, lease_owner = NULL,"
+                " lease_expires_at = NULL, updated_at = ? WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                (error, error_status, time.time(), job_id, self.owner),
+            )
+
+    def renew_leases(self, job_ids: List[str]) -> None:
+        """Extends this store's leases on the given running jobs."""
+        if not job_ids:
+            return
+        placeholders = ",".join("?" * len(job_ids))
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET lease_expires_at = ? WHERE lease_owner = ? AND status = 'running'"
+                f" AND id IN ({placeholders})",
+                (time.time() + self.lease_seconds, self.owner, *job_ids),
+            )
+
+    def requeue_stale(self) -> int:
+        """Puts running jobs whose lease ran out, because their process died, back in the queue."""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', lease_owner = NULL, lease_expires_at = NULL, updated_at = ?"
+                " WHERE status = 'running' AND (lease_expires_at IS NULL OR lease_expires_at < ?)",
+                (now, now),
+            )
+        return cursor.rowcount
+
+    def requeue_owned(self) -> int:
+        """Puts the jobs leased to this store back in the queue, e.g. on shutdown."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', lease_owner = NULL, lease_expires_at = NULL, updated_at = ?"
+                " WHERE status = 'running' AND lease_owner = ?",
+                (time.time(), self.owner),
+            )
+        return cursor.rowcount
+
+    def purge_finished(self, older_than_seconds: float) -> int:
+        """Deletes succeeded and failed jobs last updated more than `older_than_seconds` ago."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?",
+                (time.time() - older_than_seconds,),
+            )
+        return cursor.rowcount
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def count_by_status(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row, **overrides: Any) -> Dict[str, Any]:
+        job = dict(row)
+        job.pop("lease_owner", None)
+        job.pop("lease_expires_at", None)
+        job["options"] = json.loads(job["options"])
+        job["progress"] = json.loads(job["progress"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        job.update(overrides)
+        return job
+
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Any]]
+# Maps an exception raised by the handler to (HTTP status code, error message).
+ErrorMapper = Callable[[Exception], Tuple[int, str]]
+
+
+class JobWorkerPool:
+    """
+    A fixed number of asyncio workers that take jobs from a JobStore.
+    Throughput is governed by the worker count, not by how many clients are
+    connected. Workers sleep until notify() is called or the poll interval passes.
+    A maintenance task renews the leases of the running jobs, re-queues jobs
+    whose lease ran out and deletes finished jobs older than `retention_seconds`
+    (0 keeps them).
+    """
+    def __init__(
+        self, store: JobStore, handler: JobHandler, error_mapper: ErrorMapper,
+        workers: int, poll_interval: float = 5.0, retention_seconds: float = 0,
+    ):
+        self.store = store
+        self.handler = handler
+        self.error_mapper = error_mapper
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._running: Set[str] = set()
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._maintain()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Interrupted jobs can be picked up right away instead of once their lease runs out.
+        requeued = await asyncio.to_thread(self.store.requeue_owned)
+        if requeued:
+            logger.info("Re-queued %d interrupted job(s).", requeued)
+
+    def notify(self) -> None:
+        """Wakes idle workers after a job was queued."""
+        self._wakeup.set()
+
+    async def _maintain(self) -> None:
+        # Renewing three times per lease keeps a live job's lease from running
+        # out when a renewal is delayed.
+        interval = self.store.lease_seconds / 3
+        while True:
+            try:
+                await asyncio.to_thread(self.store.renew_leases, list(self._running))
+                requeued = await asyncio.to_thread(self.store.requeue_stale)
+                if requeued:
+                    logger.info("Re-queued %d job(s) whose worker stopped.", requeued)
+                    self.notify()
+                if self.retention_seconds > 0:
+                    purged = await asyncio.to_thread(self.store.purge_finished, self.retention_seconds)
+                    if purged:
+                        logger.info("Deleted %d finished job(s).", purged)
+            except sqlite3.Error:
+                logger.exception("Job maintenance failed.")
+            await asyncio.sleep(interval)
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            self._wakeup.clear()
+            job = await asyncio.to_thread(self.store.claim_next)
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # A job's logs carry its id as the request id.
+            self._running.add(job["id"])
+            with log_context(request_id=job["id"]):
+                logger.info("Worker %d started job %s.", index, job["id"])
+                try:
+                    result = await self.handler(job)
+                except asyncio.CancelledError:
+                    raise # Re-queued by stop(), or once the lease runs out if the process dies.
+                except Exception as e:
+                    error_status, error = self.error_mapper(e)
+                    await asyncio.to_thread(self.store.fail, job["id"], error, error_status)
+                    logger.warning("Worker %d failed job %s: %s", index, job["id"], error)
+                else:
+                    await asyncio.to_thread(self.store.succeed, job["id"], result)
+                    logger.info("Worker %d finished job %s.", index, job["id"])
+                finally:
+                    self._running.discard(job["id"])
@@ -0,0 +1,75 @@
+import re
+from typing import Dict, List, Tuple
+
+from models.classificationModel import DocumentType, SimpleClassification
+
+# Weighted keyword/regex features per document type. Patterns tolerate the
+# Markdown heading and bold markers that the PDF backends emit.
+FEATURES: Dict[DocumentType, List[Tuple[str, re.Pattern, float]]] = {
+    DocumentType.RESUME: [
+        ("Education section", re.compile(r"(?im)^[#*\s]*(education|academic background)[*:\s]*$"), 2.0),
+        ("Experience section", re.compile(
+            r"(?im)^[#*\s]*(work experience|professional experience|experience|employment history)[*:\s]*$"), 2.0),
+        ("Skills section", re.compile(r"(?im)^[#*\s]*(technical skills|skills)[*:\s]*$"), 1.0),
+        ("Projects or certifications section", re.compile(r"(?im)^[#*\s]*(projects|certifications?)[*:\s]*$"), 1.0),
+        ("email address", re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+"), 1.0),
+        ("LinkedIn profile", re.compile(r"(?i)linkedin\.com/in/"), 1.0),
+    ],
+    DocumentType.README: [
+        ("'runs:' block", re.compile(r"(?m)^\s*runs:\s*$"), 3.0),
+        ("'using:' runtime", re.compile(r"(?m)^\s*using:\s*['\"]?(composite|docker|node\d+)"), 3.0),
+        ("'inputs:'/'outputs:' block", re.compile(r"(?m)^\s*(inputs|outputs):\s*$"), 1.0),
+        ("'branding:' block", re.compile(r"(?m)^\s*branding:\s*$"), 1.0),
+        ("'uses: owner/repo@ref' reference", re.compile(r"uses:\s*[\w.-]+/[\w./-]+@[\w.-]+"), 1.5),
+        ("mention of GitHub Actions", re.compile(r"(?i)github actions?\b"), 1.0),
+        ("action.yml file", re.compile(r"(?i)\baction\.ya?ml\b"), 1.0),
+    ],
+    DocumentType.CITATION: [
+        ("Abstract", re.compile(r"(?im)^[#*\s]*abstract\b"), 2.0),
+        ("References section", re.compile(r"(?im)^[#*\s]*(references|bibliography)[*:\s]*$"), 2.0),
+        ("Introduction section", re.compile(r"(?im)^[#*\s]*(\d+\.?\s*)?introduction\b"), 1.0),
+        ("DOI", re.compile(r"\b10\.\d{4,9}/\S+"), 1.0),
+        ("arXiv identifier", re.compile(r"(?i)\barxiv\b"), 1.0),
+        ("'et al.' citation", re.compile(r"(?i)\bet al\."), 1.0),
+        ("'cff-version:' key", re.compile(r"(?m)^\s*cff-version:"), 3.0),
+        ("Keywords", re.compile(r"(?i)\b(keywords|index terms)\b"), 0.5),
+    ],
+}
+
+# Extensions that determine the document type on their own.
+EXTENSION_TYPES: Dict[str, DocumentType] = {
+    ".bib": DocumentType.CITATION,
+}
+
+# Score at which the evidence for a type counts as strong.
+STRONG_SCORE = 6.0
+
+
+def classify_locally(content: str, extension: str = "") -> Tuple[SimpleClassification, float]:
+    """
+    Classifies a document from keyword and regex features of its first chunk.
+    Returns the best guess and a confidence in [0, 1]: the best type's share of
+    the total score, scaled down while the best score is below STRONG_SCORE.
+    """
+    doc_type = EXTENSION_TYPES.get(extension.lower())
+    if doc_type is not None:
+        return SimpleClassification(
+            type=doc_type, description=f"Classified locally from the '{extension}' file extension."
+        ), 1.0
+
+    scores: Dict[DocumentType, float] = {}
+    matches: Dict[DocumentType, List[str]] = {}
+    for doc_type, features in FEATURES.items():
+        matched = [(name, weight) for name, pattern, weight in features if pattern.search(content)]
+        matches[doc_type] = [name for name, _ in matched]
+        scores[doc_type] = sum(weight for _, weight in matched)
+
+    best_type = max(scores, key=scores.get)
+    best_score = scores[best_type]
+    total_score = sum(scores.values())
+    if not best_score:
+        return SimpleClassification(type=DocumentType.OTHER, description="No local features matched."), 0.0
+
+    confidence = (best_score / total_score) * min(1.0, best_score / STRONG_SCORE)
+    description = f"Classified locally from: {', '.join(matches[best_type])}."
+    return SimpleClassification(type=best_type, description=description), confidence
@@ -0,0 +1,153 @@
+import json
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+# Natural keys per schema definition ($defs name): alternative tuples of fields
+# that identify the same entry when it is extracted from several chunks.
+NaturalKeys = Dict[str, Sequence[Tuple[str, ...]]]
+
+# One schema variant a value may match: the $defs name (if any) and its resolved schema.
+Variant = Tuple[Optional[str], Dict[str, Any]]
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == "" or value == [] or value == {}
+
+
+def _normalize(value: Any) -> Hashable:
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    if isinstance(value, (int, float, bool)):
+        return value
+    return json.dumps(value, sort_keys=True)
+
+
+class MergeAccumulator:
+    """
+    Merges the partial JSON of each chunk into one document, guided by the
+    model's JSON schema.
+
+    Objects are merged field by field; a field keeps its first non-empty value.
+    Every list carries a hash index: scalar items are deduplicated by value, and
+    object items by their natural keys (see NaturalKeys), so the same entry read
+    from two overlapping chunks is merged into one instead of being appended
+    twice. Objects without a natural key are deduplicated only when identical.
+    Each merge costs time proportional to the size of the partial data.
+    """
+    def __init__(self, schema: Dict[str, Any], natural_keys: Optional[NaturalKeys] = None):
+        self.schema = schema
+        self.defs: Dict[str, Any] = schema.get("$defs", {})
+        self.natural_keys = natural_keys or {}
+        self.data: Dict[str, Any] = {}
+        # id(list) -> (list, index); the list is kept so its id cannot be reused.
+        self._indexes: Dict[int, Tuple[List[Any], Dict[Hashable, Any]]] = {}
+
+    def merge(self, partial_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Merges one chunk's output into `data` and returns it."""
+        self._merge_object(self.data, partial_data, [(None, self.schema)])
+        return self.data
+
+    # --- Schema resolution ---
+
+    def _variants(self, node: Optional[Dict[str, Any]]) -> List[Variant]:
+        """Resolves $ref and anyOf/oneOf (dropping null) into the schemas a value may match."""
+        if not isinstance(node, dict):
+            return []
+        if "$ref" in node:
+            name = node["$ref"].rsplit("/", 1)[-1]
+            return [(name, self.defs.get(name, {}))]
+        for union in ("anyOf", "oneOf"):
+            if union in node:
+                variants: List[Variant] = []
+                for option in node[union]:
+                    if option.get("type") != "null":
+                        variants.extend(self._variants(option))
+                return variants
+        return [(None, node)]
+
+    def _child_variants(self, variants: List[Variant], key: str) -> List[Variant]:
+        """The variants of property `key` across the variants of its parent object."""
+        children: List[Variant] = []
+        for _, schema in variants:
+            node = schema.get("properties", {}).get(key)
+            if node is None and isinstance(schema.get("additionalProperties"), dict):
+                node = schema["additionalProperties"]
+            children.extend(self._variants(node))
+        return children
+
+    def _item_variants(self, variants: List[Variant]) -> List[Variant]:
+        """The variants of the items of a list."""
+        items: List[Variant] = []
+        for _, schema in variants:
+            items.extend(self._variants(schema.get("items")))
+        return items
+
+    # --- Merging ---
+
+    def _merge_object(self, target: Dict[str, Any], source: Dict[str, Any], variants: List[Variant]) -> None:
+        for key, value in source.items():
+            if _is_empty(value):
+                continue
+            current = target.get(key)
+            if isinstance(value, dict):
+                if _is_empty(current):
+                    current = target[key] = {}
+                if isinstance(current, dict):
+                    self._merge_object(current, value, self._child_variants(variants, key))
+            elif isinstance(value, list):
+                if _is_empty(current):
+                    current = target[key] = []
+                if isinstance(current, list):
+                    self._extend_list(current, value, self._child_variants(variants, key))
+            elif _is_empty(current):
+                target[key] = value
+
+    def _extend_list(self, target: List[Any], items: List[Any], variants: List[Variant]) -> None:
+        _, index = self._indexes.setdefault(id(target), (target, {}))
+        item_variants = self._item_variants(variants)
+        for item in items:
+            if _is_empty(item):
+                continue
+            if not isinstance(item, (dict, list)):
+                key = ("value", item)
+                if key not in index:
+                    index[key] = item
+                    target.append(item)
+                continue
+            if isinstance(item, list):
+                key = ("item", _normalize(item))
+                if key not in index:
+                    index[key] = item
+                    target.append(item)
+                continue
+
+            keys = self._natural_keys(item, item_variants)
+            existing = next((index[k] for k in keys if k in index), None)
+            if existing is None:
+                fingerprint = ("item", _normalize(item))
+                if not keys and fingerprint in index:
+                    continue
+                existing = {}
+                target.append(existing)
+                index[fingerprint] = existing
+            self._merge_object(existing, item, self._matching_variants(item, item_variants))
+            # The merged entry may now be reachable through more of its natural keys.
+            for key in self._natural_keys(existing, item_variants):
+                index.setdefault(key, existing)
+
+    def _natural_keys(self, item: Dict[str, Any], variants: List[Variant]) -> List[Hashable]:
+        """Every natural key of `item` whose fields are all populated."""
+        keys: List[Hashable] = []
+        for name, _ in variants:
+            for fields in self.natural_keys.get(name, ()):
+                if all(not _is_empty(item.get(field)) for field in fields):
+                    keys.append((name, fields, tuple(_normalize(item[field]) for field in fields)))
+        return keys
+
+    @staticmethod
+    def _matching_variants(item: Dict[str, Any], variants: List[Variant]) -> List[Variant]:
+        """Narrows a union to the variants whose required fields the item has, if any."""
+        matching = [
+            (name, schema) for name, schema in variants
+            if all(field in item for field in schema.get("required", []))
+        ]
+        return matching or variants
@@ -0,0 +1,265 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+# Latency buckets in seconds, from a cache hit to a long LLM call or a huge PDF.
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Buckets for per-document counts (chunks) and token counts.
+COUNT_BUCKETS: Tuple[float, ...] = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+TOKEN_BUCKETS: Tuple[float, ...] = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    """Base of the metric types: a name, a help text and values per label combination."""
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _label_values(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> List[Tuple[str, Sequence[Tuple[str, str]], float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for suffix, pairs, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(pairs)} {_format_number(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """A value that only goes up, such as a number of calls or tokens."""
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels: str) -> float:
+        key = self._label_values(labels)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [("_total", list(zip(self.labelnames, key)), value) for key, value in items]
+
+
+class Gauge(_Metric):
+    """A value that can go up and down, set directly or read from a function at scrape time."""
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function: Callable[[], float], **labels: str) -> None:
+        key = self._label_values(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            values[key] = function()
+        return [("", list(zip(self.labelnames, key)), value) for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    """Counts observations (e.g. durations) in cumulative buckets, with their sum and count."""
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # label values -> (count per bucket, sum)
+        self._values: Dict[LabelValues, Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._label_values(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * len(self.buckets), 0.0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observes the duration of the `with` block, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        samples = []
+        for key, (counts, total) in items:
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append(("_bucket", pairs + [("le", _format_number(bound))], cumulative))
+            samples.append(("_sum", pairs, total))
+            samples.append(("_count", pairs, cumulative))
+        return samples
+
+
+class Registry:
+    """The metrics exposed together, in the Prometheus text format."""
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# --- Application metrics ---
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "extractor_stage_seconds",
+    "Time spent in each stage of processing a document.",
+    ("stage",),
+)
+DOCUMENT_SECONDS = REGISTRY.histogram(
+    "extractor_document_seconds",
+    "End-to-end processing time per document.",
+    ("document_type", "outcome"),
+)
+DOCUMENT_CHUNKS = REGISTRY.histogram(
+    "extractor_document_chunks",
+    "Chunks per document: processed, reused from the chunk store, or prepared but skipped after saturation.",
+    ("kind",),
+    buckets=COUNT_BUCKETS,
+)
+DOCUMENTS = REGISTRY.counter(
+    "extractor_documents",
+    "Processed documents by type and by the last step needed to make them valid "
+    "(none, repair, targeted or full correction).",
+    ("document_type", "correction"),
+)
+TEXT_EXTRACTION_SECONDS = REGISTRY.histogram(
+    "extractor_text_extraction_seconds",
+    "Time spent waiting for a file's text to be parsed, per file format.",
+    ("format",),
+)
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    "extractor_llm_request_seconds",
+    "Duration of single LLM API calls.",
+    ("outcome",),
+)
+LLM_INFERENCE_SECONDS = REGISTRY.histogram(
+    "extractor_llm_inference_seconds",
+    "Duration of run_inference_async, including the cache lookup, retries and hedging.",
+    ("source",),
+)
+LLM_TOKENS = REGISTRY.counter(
+    "extractor_llm_tokens",
+    "Tokens reported by the LLM API.",
+    ("kind",),
+)
+LLM_CALL_TOKENS = REGISTRY.histogram(
+    "extractor_llm_call_tokens",
+    "Total tokens per LLM call.",
+    buckets=TOKEN_BUCKETS,
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "extractor_cache_lookups",
+    "Lookups per cache (llm, document, chunk) and result (hit, miss).",
+    ("cache", "result"),
+)
+CACHE_HIT_RATIO = REGISTRY.gauge(
+    "extractor_cache_hit_ratio",
+    "Share of cache lookups that were hits since startup.",
+    ("cache",),
+)
+
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def _hit_ratio(cache: str) -> Callable[[], float]:
+    def ratio() -> float:
+        hits = CACHE_LOOKUPS.get(cache=cache, result="hit")
+        lookups = hits + CACHE_LOOKUPS.get(cache=cache, result="miss")
+        return hits / lookups if lookups else 0.0
+    return ratio
+
+
+for _cache in ("llm", "document", "chunk"):
+    CACHE_HIT_RATIO.set_function(_hit_ratio(_cache), cache=_cache)
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,72 @@
+import asyncio
+from typing import Any, AsyncIterator, List, Optional
+
+# Marks the end of a stream passed through an asyncio.Queue.
+END = object()
+
+
+async def feed_queue_async(source: AsyncIterator[Any], queue: asyncio.Queue) -> None:
+    """
+    Copies every item of `source` into `queue`, followed by END.
+    An exception raised by the source is put into the queue instead of END,
+    so the consumer re-raises it in its own task.
+    """
+    try:
+        async for item in source:
+            await queue.put(item)
+    except Exception as e:
+        await queue.put(e)
+        return
+    await queue.put(END)
+
+
+async def iter_queue_async(queue: asyncio.Queue) -> AsyncIterator[Any]:
+    """Yields the items fed by feed_queue_async until END, re-raising a forwarded exception."""
+    while True:
+        item = await queue.get()
+        if item is END:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+class ReplayableQueueReader:
+    """
+    Reads a fed queue and remembers what it read until commit() is called.
+    This lets a consumer start speculatively (e.g. chunking with a guessed
+    document type) and, if the guess was wrong, start over with replay()
+    without losing the items the abandoned consumer already took.
+    """
+    def __init__(self, queue: asyncio.Queue):
+        self.queue = queue
+        self._log: Optional[List[Any]] = []
+        self._done = False
+        self._error: Optional[BaseException] = None
+
+    async def read(self) -> AsyncIterator[Any]:
+        while not self._done:
+            item = await self.queue.get()
+            if item is END:
+                self._done = True
+            elif isinstance(item, BaseException):
+                self._done = True
+                self._error = item
+            else:
+                if self._log is not None:
+                    self._log.append(item)
+                yield item
+        if self._error is not None:
+            raise self._error
+
+    def commit(self) -> None:
+        """Stops recording; items read so far can no longer be replayed."""
+        self._log = None
+
+    async def replay(self) -> AsyncIterator[Any]:
+        """Yields every recorded item again, then continues reading the queue."""
+        log, self._log = self._log or [], None
+        for item in log:
+            yield item
+        async for item in self.read():
+            yield item
@@ -0,0 +1,208 @@
+import time
+import asyncio
+from typing import Any, Dict, Mapping, Optional
+
+# Conservative characters-per-token estimate for prompts; the bucket is
+# corrected with the real usage the API reports once a call returns.
+CHARS_PER_TOKEN_ESTIMATE = 3
+
+
+def estimate_tokens(prompt: str, completion_tokens: int) -> int:
+    """Estimates the tokens a call will consume: the prompt plus the expected completion."""
+    return -(-len(prompt) // CHARS_PER_TOKEN_ESTIMATE) + completion_tokens
+
+
+def parse_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """Reads the delay requested by a 429 response from 'retry-after-ms' or 'retry-after' (seconds)."""
+    if not headers:
+        return None
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value) * scale)
+        except ValueError:
+            continue # HTTP-date form; fall back to the controller's own backoff.
+    return None
+
+
+class TokenBucket:
+    """
+    Refills continuously at `per_minute` units per minute up to `capacity`.
+    The level may go negative when a reservation is corrected upwards; the
+    debt is then paid off by the refill before anything else is admitted.
+    A rate of 0 disables the bucket.
+    """
+    def __init__(self, per_minute: float, capacity: float):
+        self.per_minute = per_minute
+        self.capacity = max(1.0, capacity)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return self.per_minute > 0
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.per_minute / 60.0)
+        self._updated = now
+
+    def time_until(self, amount: float, now: float) -> float:
+        """Seconds until `amount` units are available (0 if they are now)."""
+        if not self.enabled:
+            return 0.0
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing * 60.0 / self.per_minute)
+
+    def consume(self, amount: float, now: float) -> None:
+        if self.enabled:
+            self._refill(now)
+            self.level -= amount
+
+
+class AIMDController:
+    """
+    Additive-increase/multiplicative-decrease concurrency limit.
+    Every successful call raises the limit by 1/limit (about +1 per round of
+    calls), and a throttled call multiplies it by `decrease_factor`. Throttles
+    from calls started before the last decrease are ignored, so one burst of
+    429s shrinks the limit once instead of collapsing it to the minimum.
+    """
+    def __init__(self, maximum: int, minimum: int = 1, decrease_factor: float = 0.5):
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.decrease_factor = decrease_factor
+        self.limit = float(self.maximum)
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> float:
+        """Waits for a free slot and returns the time the call started."""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return time.monotonic()
+
+    async def release(self) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self) -> None:
+        self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+
+    def on_throttle(self, started_at: float) -> None:
+        if started_at < self._last_decrease:
+            return
+        self.limit = max(float(self.minimum), self.limit * self.decrease_factor)
+        self._last_decrease = time.monotonic()
+
+
+class RateLimiter:
+    """
+    Process-wide admission control for LLM calls: a request bucket (RPM), a
+    token bucket (TPM) and an AIMD concurrency limit. A 429 shrinks the
+    concurrency limit and, if it carries a retry-after delay, pauses every new
+    call until the delay has passed.
+    """
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        max_concurrency: int,
+        min_concurrency: int = 1,
+        burst_seconds: float = 10.0,
+        headroom: float = 0.95,
+    ):
+        # Buckets refill slightly below the quota and hold only a few seconds'
+        # worth, so a full bucket cannot overshoot the provider's window.
+        rpm = requests_per_minute * headroom
+        tpm = tokens_per_minute * headroom
+        self.requests = TokenBucket(rpm, rpm * burst_seconds / 60.0)
+        self.tokens = TokenBucket(tpm, tpm * burst_seconds / 60.0)
+        self.concurrency = AIMDController(max_concurrency, min_concurrency)
+        self._paused_until = 0.0
+        self._admission_lock = asyncio.Lock()
+        self.waiting = 0
+        self.successes = 0
+        self.throttles = 0
+        self.estimated_tokens = 0
+        self.reported_tokens = 0
+
+    async def acquire(self, estimated_tokens: int) -> float:
+        """
+        Waits for a concurrency slot and for both buckets, in arrival order.
+        Returns the time the call was admitted, to pass to on_throttle();
+        release() must follow.
+        """
+        self.waiting += 1
+        try:
+            await self.concurrency.acquire()
+        except BaseException:
+            self.waiting -= 1
+            raise
+        try:
+            async with self._admission_lock:
+                while True:
+                    now = time.monotonic()
+                    delay = max(
+                        self._paused_until - now,
+                        self.requests.time_until(1, now),
+                        self.tokens.time_until(estimated_tokens, now),
+                    )
+                    if delay <= 0:
+                        break
+                    await asyncio.sleep(delay)
+                self.requests.consume(1, now)
+                self.tokens.consume(estimated_tokens, now)
+        except BaseException:
+            await self.concurrency.release()
+            raise
+        finally:
+            self.waiting -= 1
+        return time.monotonic()
+
+    def is_throttling(self) -> bool:
+        """Whether calls are queued for admission or paused by a retry-after."""
+        return self.waiting > 0 or self._paused_until > time.monotonic()
+
+    async def release(self) -> None:
+        await self.concurrency.release()
+
+    def on_success(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        """Grows the concurrency limit and corrects the token bucket with the reported usage."""
+        self.successes += 1
+        self.concurrency.on_success()
+        self.estimated_tokens += estimated_tokens
+        if actual_tokens is not None:
+            self.reported_tokens += actual_tokens
+            self.tokens.consume(actual_tokens - estimated_tokens, time.monotonic())
+
+    def on_throttle(self, started_at: float, retry_after: Optional[float]) -> None:
+        self.throttles += 1
+        self.concurrency.on_throttle(started_at)
+        if retry_after:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        self.requests.time_until(0, now)
+        self.tokens.time_until(0, now)
+        return {
+            "concurrency_limit": round(self.concurrency.limit, 2),
+            "max_concurrency": self.concurrency.maximum,
+            "in_flight": self.concurrency.in_flight,
+            "waiting": self.waiting,
+            "requests_per_minute": self.requests.per_minute,
+            "request_bucket_level": round(self.requests.level, 2) if self.requests.enabled else None,
+            "tokens_per_minute": self.tokens.per_minute,
+            "token_bucket_level": round(self.tokens.level, 2) if self.tokens.enabled else None,
+            "paused_for_seconds": round(max(0.0, self._paused_until - now), 3),
+            "successes": self.successes,
+            "throttles": self.throttles,
+            "estimated_tokens": self.estimated_tokens,
+            "reported_tokens": self.reported_tokens,
+        }
@@ -0,0 +1,186 @@
+import re
+import copy
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, Union
+
+from pydantic import BaseModel, ValidationError
+
+from models.citationModel import CitationFile
+from models.githubActionModel import GitHubAction
+from utils.correction import JsonPath
+
+# Returned by a repairer to remove the failing value (a dict key or a list item).
+DELETE = object()
+
+# A value repairer gets the failing value and returns its replacement, DELETE,
+# or None if it cannot fix it.
+ValueRepairer = Callable[[Any], Any]
+# A schema repairer fixes known problems of one model in place and returns the number of fixes.
+SchemaRepairer = Callable[[Dict[str, Any]], int]
+
+DATE_FORMATS = [
+    "%Y-%m-%d", "%Y/%m/%d", "%Y.%m.%d", "%d.%m.%Y", "%m/%d/%Y", "%d/%m/%Y",
+    "%B %d, %Y", "%b %d, %Y", "%B %d %Y", "%b %d %Y", "%d %B %Y", "%d %b %Y",
+    "%B %Y", "%b %Y", "%m/%Y", "%m.%Y", "%Y-%m", "%Y/%m", "%Y",
+]
+URL_WITHOUT_SCHEME = re.compile(r"^(www\.)?[\w-]+(\.[\w-]+)*\.[a-z]{2,}(:\d+)?([/?#].*)?$", re.IGNORECASE)
+
+
+def _parse_date(value: Any) -> Optional[datetime]:
+    """Parses common written dates; missing months and days default to the first."""
+    if not isinstance(value, str):
+        return None
+    text = re.sub(r"(\d)(st|nd|rd|th)\b", r"\1", value.strip()).replace("Sept", "Sep")
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+    return None
+
+
+def repair_date(value: Any) -> Optional[str]:
+    parsed = _parse_date(value)
+    return parsed.date().isoformat() if parsed else None
+
+
+def repair_datetime(value: Any) -> Optional[str]:
+    parsed = _parse_date(value)
+    return parsed.isoformat() if parsed else None
+
+
+def repair_url(value: Any) -> Optional[str]:
+    """Adds the https:// scheme to URLs written without one."""
+    if not isinstance(value, str):
+        return None
+    text = value.strip()
+    if text.startswith("//"):
+        return "https:" + text
+    if URL_WITHOUT_SCHEME.match(text):
+        return "https://" + text
+    return None
+
+
+def drop_empty_string(value: Any) -> Any:
+    return DELETE if isinstance(value, str) and not value.strip() else None
+
+
+def _value_repairer(error_type: str) -> Optional[ValueRepairer]:
+    """Picks the repairer for a pydantic error type."""
+    if error_type.startswith("datetime_"):
+        return repair_datetime
+    if error_type.startswith("date_"):
+        return repair_date
+    if error_type.startswith("url_"):
+        return repair_url
+    if error_type == "string_too_short":
+        return drop_empty_string
+    return None
+
+
+def repair_cff_version(data: Dict[str, Any]) -> int:
+    """CitationFile only accepts CFF 1.2.0."""
+    if data.get("cff_version") == "1.2.0":
+        return 0
+    data["cff_version"] = "1.2.0"
+    return 1
+
+
+def repair_action_outputs(data: Dict[str, Any]) -> int:
+    """Outputs of Docker and JavaScript actions must not carry a 'value'."""
+    runs, outputs = data.get("runs"), data.get("outputs")
+    if not isinstance(runs, dict) or runs.get("using") == "composite" or not isinstance(outputs, dict):
+        return 0
+    fixes = 0
+    for output in outputs.values():
+        if isinstance(output, dict) and "value" in output:
+            del output["value"]
+            fixes += 1
+    return fixes
+
+
+SCHEMA_REPAIRERS: Dict[Type[BaseModel], List[SchemaRepairer]] = {
+    CitationFile: [repair_cff_version],
+    GitHubAction: [repair_action_outputs],
+}
+
+
+def _data_path(data: Any, loc: JsonPath) -> Optional[JsonPath]:
+    """
+    Maps an error location to the path of the failing value, skipping pydantic's
+    union tags (e.g. 'Person'). Returns None if the value does not exist.
+    """
+    path: List[Union[str, int]] = []
+    node = data
+    for element in loc:
+        if isinstance(node, list) and isinstance(element, int) and 0 <= element < len(node):
+            node = node[element]
+        elif isinstance(node, dict) and element in node:
+            node = node[element]
+        elif isinstance(node, dict) and isinstance(element, str):
+            continue
+        else:
+            return None
+        path.append(element)
+    return tuple(path) if path and path[-1] == loc[-1] else None
+
+
+def _apply_fixes(data: Dict[str, Any], fixes: Dict[JsonPath, Any]) -> None:
+    deletions: List[JsonPath] = []
+    for path, value in fixes.items():
+        if value is DELETE:
+            deletions.append(path)
+            continue
+        parent = data
+        for element in path[:-1]:
+            parent = parent[element]
+        parent[path[-1]] = value
+    # Deepest first, and later list items before earlier ones, so indexes stay valid.
+    deletions.sort(key=lambda p: (len(p), p[-1] if isinstance(p[-1], int) else -1), reverse=True)
+    for path in deletions:
+        parent = data
+        for element in path[:-1]:
+            parent = parent[element]
+        del parent[path[-1]]
+
+
+def _repair_errors(data: Dict[str, Any], errors: List[Dict[str, Any]]) -> int:
+    fixes: Dict[JsonPath, Any] = {}
+    for error in errors:
+        repairer = _value_repairer(error["type"])
+        loc = tuple(error["loc"])
+        if repairer is None or not loc:
+            continue
+        path = _data_path(data, loc)
+        if path is None or path in fixes:
+            continue
+        value = repairer(error.get("input"))
+        if value is not None and value != error.get("input"):
+            fixes[path] = value
+    _apply_fixes(data, fixes)
+    return len(fixes)
+
+
+def repair_document(
+    model: Type[BaseModel], data: Dict[str, Any], error: ValidationError, max_rounds: int = 3
+) -> Tuple[Dict[str, Any], int]:
+    """
+    Fixes mechanical validation failures without the LLM: the schema's own
+    repairers run first, then value repairers for each error type (non-ISO
+    dates, URLs without a scheme, empty strings). Fixing one error can reveal
+    another, so this repeats for up to `max_rounds` rounds. Returns the repaired
+    copy of `data` and the number of fixes made.
+    """
+    data = copy.deepcopy(data)
+    total = sum(repairer(data) for repairer in SCHEMA_REPAIRERS.get(model, ()))
+    for _ in range(max_rounds):
+        fixes = _repair_errors(data, error.errors())
+        total += fixes
+        if not fixes:
+            break
+        try:
+            model.model_validate(data)
+            break
+        except ValidationError as remaining:
+            error = remaining
+    return data, total
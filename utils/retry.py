@@ -0,0 +1,91 @@
+import random
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Optional, Set, Tuple, Type, TypeVar
+
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+T = TypeVar("T")
+
+# Errors worth another attempt: throttling, timeouts, dropped connections and 5xx.
+RETRYABLE_ERRORS: Tuple[Type[BaseException], ...] = (
+    RateLimitError, APITimeoutError, APIConnectionError, InternalServerError, asyncio.TimeoutError,
+)
+
+
+def is_retryable(error: BaseException) -> bool:
+    return isinstance(error, RETRYABLE_ERRORS)
+
+
+def backoff_delay(attempt: int, base: float, cap: float, retry_after: Optional[float] = None) -> float:
+    """
+    Exponential backoff with full jitter: a random delay up to base * 2**attempt,
+    capped at `cap`. A server-provided retry-after is treated as the minimum.
+    """
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    return max(delay, retry_after or 0.0)
+
+
+class LatencyTracker:
+    """Keeps the latencies of the last `window` successful calls to estimate percentiles."""
+    def __init__(self, window: int = 200):
+        self._samples: deque = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def hedged_async(
+    call: Callable[[asyncio.Event], Awaitable[T]],
+    hedge_after: Optional[float],
+    on_hedge: Optional[Callable[[], None]] = None,
+    can_hedge: Optional[Callable[[], bool]] = None,
+) -> Tuple[T, bool]:
+    """
+    Runs `call`, which sets the event it is given once the request has actually
+    been sent (e.g. after rate limiting). If it has not finished `hedge_after`
+    seconds after that, and `can_hedge` allows it, starts a second identical
+    call and returns whichever succeeds first, cancelling the other. Fails only
+    when every started call fails. Returns the result and whether the hedge produced it.
+    """
+    if hedge_after is None:
+        return await call(asyncio.Event()), False
+
+    admitted = asyncio.Event()
+    primary = asyncio.create_task(call(admitted))
+    pending: Set[asyncio.Task] = {primary}
+    try:
+        admission = asyncio.create_task(admitted.wait())
+        try:
+            await asyncio.wait({primary, admission}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            admission.cancel()
+        if not primary.done():
+            await asyncio.wait({primary}, timeout=hedge_after)
+        if primary.done() or (can_hedge is not None and not can_hedge()):
+            return await primary, False
+        hedge = asyncio.create_task(call(asyncio.Event()))
+        if on_hedge is not None:
+            on_hedge()
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), task is hedge
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
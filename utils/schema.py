@@ -0,0 +1,110 @@
+from typing import Any, Dict, Iterable, List, Set, Tuple, Union
+
+
+def _iter_refs(node: Any) -> Iterable[str]:
+    """Yields the names of every '#/$defs/<name>' reference inside a schema node."""
+    if isinstance(node, dict):
+        ref = node.get("$ref")
+        if isinstance(ref, str) and ref.startswith("#/$defs/"):
+            yield ref[len("#/$defs/"):]
+        for value in node.values():
+            yield from _iter_refs(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _iter_refs(value)
+
+
+def _reachable_defs(node: Any, defs: Dict[str, Any]) -> Dict[str, Any]:
+    """The $defs a schema node references, directly or through other definitions."""
+    reachable: Set[str] = set()
+    pending = list(_iter_refs(node))
+    while pending:
+        name = pending.pop()
+        if name in reachable or name not in defs:
+            continue
+        reachable.add(name)
+        pending.extend(_iter_refs(defs[name]))
+    return {name: definition for name, definition in defs.items() if name in reachable}
+
+
+def prune_json_schema(schema: Dict[str, Any], keys: Iterable[str]) -> Dict[str, Any]:
+    """
+    Returns a copy of a model's JSON schema that only describes the given
+    top-level properties, keeping just the $defs they (transitively) reference.
+    """
+    keys = set(keys)
+    pruned = {k: v for k, v in schema.items() if k not in ("properties", "required", "$defs")}
+    pruned["properties"] = {k: v for k, v in schema.get("properties", {}).items() if k in keys}
+    required = [k for k in schema.get("required", []) if k in keys]
+    if required:
+        pruned["required"] = required
+
+    reachable = _reachable_defs(pruned["properties"], schema.get("$defs", {}))
+    if reachable:
+        pruned["$defs"] = reachable
+    return pruned
+
+
+def _variants(node: Dict[str, Any], defs: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Resolves $ref and anyOf/oneOf (dropping null) into the schemas a value may match."""
+    if "$ref" in node:
+        return _variants(defs.get(node["$ref"].rsplit("/", 1)[-1], {}), defs)
+    for union in ("anyOf", "oneOf"):
+        if union in node:
+            return [v for option in node[union] if option.get("type") != "null" for v in _variants(option, defs)]
+    return [node]
+
+
+def sub_schema(schema: Dict[str, Any], path: Tuple[Union[str, int], ...]) -> Dict[str, Any]:
+    """
+    Returns the schema of the value at `path` (property names and list indexes)
+    inside a model's JSON schema, carrying only the $defs it references.
+    """
+    defs = schema.get("$defs", {})
+    node: Dict[str, Any] = schema
+    for element in path:
+        child: Dict[str, Any] = {}
+        for variant in _variants(node, defs):
+            if isinstance(element, int) and "items" in variant:
+                child = variant["items"]
+            elif element in variant.get("properties", {}):
+                child = variant["properties"][element]
+            elif isinstance(variant.get("additionalProperties"), dict):
+                child = variant["additionalProperties"]
+            else:
+                continue
+            break
+        node = child
+    result = {k: v for k, v in node.items() if k != "$defs"}
+    reachable = _reachable_defs(result, defs)
+    if reachable:
+        result["$defs"] = reachable
+    return result
+
+
+def collection_fields(schema: Dict[str, Any]) -> Set[str]:
+    """
+    Returns the top-level properties that hold a list or a mapping, looking
+    through Optional[...] unions. Such fields keep growing as more chunks are read.
+    """
+    fields = set()
+    for name, prop in schema.get("properties", {}).items():
+        variants = prop.get("anyOf", [prop])
+        for variant in variants:
+            if variant.get("type") == "array" or (
+                variant.get("type") == "object" and "additionalProperties" in variant
+            ):
+                fields.add(name)
+    return fields
+
+
+def scalar_fields(schema: Dict[str, Any]) -> Set[str]:
+    """Returns the top-level properties typed inline as strings, numbers or booleans."""
+    fields = set()
+    for name, prop in schema.get("properties", {}).items():
+        variants = [v for v in prop.get("anyOf", [prop]) if v.get("type") != "null"]
+        if variants and all(
+            "$ref" not in v and v.get("type") not in ("object", "array") for v in variants
+        ):
+            fields.add(name)
+    return fields
@@ -0,0 +1,176 @@
+import os
+import sys
+import copy
+import json
+import uuid
+import queue
+import atexit
+import logging
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+REQUEST_ID_HEADER = "x-request-id"
+# Libraries that log every HTTP request at INFO; the LLM calls are already
+# covered by this app's own logs and metrics.
+QUIET_LOGGERS = ("httpx", "httpcore")
+
+# Set per HTTP request, job, document and chunk; asyncio tasks inherit them on
+# creation, so concurrent documents and chunks never see each other's values.
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+document_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("document_id", default=None)
+chunk_index_var: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("chunk_index", default=None)
+
+CONTEXT_VARS: Tuple[Tuple[str, contextvars.ContextVar], ...] = (
+    ("request_id", request_id_var),
+    ("document_id", document_id_var),
+    ("chunk_index", chunk_index_var),
+)
+
+_listener: Optional[QueueListener] = None
+
+
+class ContextFilter(logging.Filter):
+    """Copies the context variables onto the record in the logging task, before it is queued."""
+    def filter(self, record: logging.LogRecord) -> bool:
+        for name, var in CONTEXT_VARS:
+            setattr(record, name, var.get())
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, context and any `fields` extra."""
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name, _ in CONTEXT_VARS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _ContextQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Arguments and tracebacks are rendered in the logging task, since they
+        # may change or go away; JSON formatting and writing happen on the listener thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging(level: str = LOG_LEVEL) -> None:
+    """
+    Routes all logging through an in-memory queue to a background thread that
+    formats the records as JSON lines and writes them to stdout, so logging
+    never blocks the event loop on I/O. The QUIET_LOGGERS only pass warnings
+    and errors. Safe to call more than once.
+    """
+    global _listener
+    root = _set_levels(level)
+    if _listener is not None:
+        return
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = _ContextQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    root.handlers = [queue_handler]
+    _listener = QueueListener(log_queue, _json_stream_handler(), respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def configure_worker_logging(level: str = LOG_LEVEL) -> None:
+    """
+    Initializer for worker processes (e.g. the PDF pool). A forked worker
+    inherits the queue handler but not the listener thread, so its records
+    would never be written; it writes JSON lines to stdout directly instead.
+    """
+    global _listener
+    _listener = None
+    handler = _json_stream_handler()
+    handler.addFilter(ContextFilter())
+    _set_levels(level).handlers = [handler]
+
+
+def _set_levels(level: str) -> logging.Logger:
+    root = logging.getLogger()
+    root.setLevel(level)
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+    return root
+
+
+def _json_stream_handler() -> logging.Handler:
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+def shutdown_logging() -> None:
+    """Writes out the queued records and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+@contextmanager
+def log_context(**values: Any) -> Iterator[None]:
+    """Sets request_id, document_id and/or chunk_index for the duration of the block."""
+    variables = dict(CONTEXT_VARS)
+    tokens: List[Tuple[contextvars.ContextVar, contextvars.Token]] = []
+    try:
+        for name, value in values.items():
+            var = variables[name]
+            tokens.append((var, var.set(value)))
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class RequestContextMiddleware:
+    """
+    ASGI middleware giving every HTTP request a request id, taken from the
+    X-Request-ID header or generated. It is set for the request's logs and
+    returned in the response's X-Request-ID header.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(REQUEST_ID_HEADER.encode("latin-1"), b"").decode("latin-1") or uuid.uuid4().hex
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message = {
+                    **message,
+                    "headers": [
+                        *message.get("headers", []),
+                        (REQUEST_ID_HEADER.encode("latin-1"), request_id.encode("latin-1")),
+                    ],
+                }
+            await send(message)
+
+        with log_context(request_id=request_id):
+            await self.app(scope, receive, send_with_request_id)
@@ -1,23 +1,268 @@
 import io
 import os
+import codecs
+import asyncio
+import time
+import hashlib
+import logging
+import sqlite3
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional, Sequence, Tuple, Union
 import httpx # Use httpx for async requests
 import pdfplumber
+import pymupdf
+import pymupdf4llm
 import bibtexparser
 
-# --- Internal helper functions for reading from memory ---
+from utils.cache import PageTextCache
+from utils.metrics import TEXT_EXTRACTION_SECONDS
+from utils.structuredLogger import configure_worker_logging
 
-def _read_text_from_pdf_from_memory(file_bytes: bytes) -> str:
-    """Reads text from a PDF file's bytes."""
-    with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
-        text = "".join([page.extract_text() or "" for page in pdf.pages])
-    return text
+logger = logging.getLogger(__name__)
+
+# --- PDF Parsing Configuration ---
+# PyMuPDF is the fast default; pdfplumber re-reads pages the fast engine returns empty.
+PDF_BACKEND = os.getenv("PDF_BACKEND", "pymupdf")
+PDF_FALLBACK_BACKEND = os.getenv("PDF_FALLBACK_BACKEND", "pdfplumber")
+# PDF parsing is CPU-bound, so it runs in worker processes instead of on the event loop.
+PDF_PROCESS_WORKERS = int(os.getenv("PDF_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "20"))
+MAX_PDF_PAGES = int(os.getenv("MAX_PDF_PAGES", "1000"))
+MAX_PDF_BYTES = int(os.getenv("MAX_PDF_BYTES", str(100 * 1024 * 1024)))
+TEXT_READ_BLOCK_SIZE = 1024 * 1024
+# Text of already parsed pages, keyed by a hash of each page's content stream.
+PDF_PAGE_CACHE_ENABLED = os.getenv("PDF_PAGE_CACHE_ENABLED", "true").lower() == "true"
+PDF_PAGE_CACHE_DB_PATH = os.getenv("PDF_PAGE_CACHE_DB_PATH", os.path.join(".cache", "pdf_pages.sqlite3"))
+PDF_PAGE_CACHE_MAX_BYTES = int(os.getenv("PDF_PAGE_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+PDF_PAGE_CACHE_MMAP_SIZE = int(os.getenv("PDF_PAGE_CACHE_MMAP_SIZE", str(PDF_PAGE_CACHE_MAX_BYTES)))
+
+_pdf_executor: Optional[ProcessPoolExecutor] = None
+
+def get_pdf_executor() -> ProcessPoolExecutor:
+    """Returns the process pool used for PDF parsing, creating it on first use."""
+    global _pdf_executor
+    if _pdf_executor is None:
+        _pdf_executor = ProcessPoolExecutor(max_workers=PDF_PROCESS_WORKERS, initializer=configure_worker_logging)
+    return _pdf_executor
+
+def shutdown_pdf_executor() -> None:
+    """Stops the PDF worker processes. Called on app shutdown."""
+    global _pdf_executor
+    if _pdf_executor is not None:
+        _pdf_executor.shutdown(wait=False, cancel_futures=True)
+        _pdf_executor = None
+
+# Opened lazily in each PDF worker process; the pid guards against a forked copy.
+_page_cache: Optional[Tuple[int, PageTextCache]] = None
+
+def _get_page_cache() -> Optional[PageTextCache]:
+    global _page_cache
+    if not PDF_PAGE_CACHE_ENABLED:
+        return None
+    if _page_cache is None or _page_cache[0] != os.getpid():
+        _page_cache = (os.getpid(), PageTextCache(
+            PDF_PAGE_CACHE_DB_PATH, max_bytes=PDF_PAGE_CACHE_MAX_BYTES, mmap_size=PDF_PAGE_CACHE_MMAP_SIZE
+        ))
+    return _page_cache[1]
+
+# --- PDF backends ---
+# Each backend reads the given 0-based pages of a PDF, passed either as bytes or
+# as a file path, and returns their texts together with the document's total
+# page count. Page numbers past the end are ignored.
+PdfSource = Union[bytes, str]
+
+def _extract_pages_pdfplumber(source: PdfSource, page_numbers: Sequence[int]) -> Tuple[List[str], int]:
+    with pdfplumber.open(io.BytesIO(source) if isinstance(source, bytes) else source) as pdf:
+        page_count = len(pdf.pages)
+        texts = [pdf.pages[i].extract_text() or "" for i in page_numbers if i < page_count]
+    return texts, page_count
+
+def _extract_pages_pymupdf(source: PdfSource, page_numbers: Sequence[int]) -> Tuple[List[str], int]:
+    doc = pymupdf.open(stream=source, filetype="pdf") if isinstance(source, bytes) else pymupdf.open(source)
+    with doc:
+        page_count = doc.page_count
+        pages = [i for i in page_numbers if i < page_count]
+        if not pages: # to_markdown reads every page when given an empty list
+            return [], page_count
+        page_chunks = pymupdf4llm.to_markdown(doc, pages=pages, page_chunks=True)
+    return [chunk["text"] for chunk in page_chunks], page_count
+
+PDF_BACKENDS: Dict[str, Callable[[PdfSource, Sequence[int]], Tuple[List[str], int]]] = {
+    "pymupdf": _extract_pages_pymupdf,
+    "pdfplumber": _extract_pages_pdfplumber,
+}
+
+def _resolve_pdf_backend(name: Optional[str]) -> str:
+    name = (name or PDF_BACKEND).lower()
+    if name not in PDF_BACKENDS:
+        raise ValueError(f"Unknown PDF backend: '{name}'. Available: {', '.join(PDF_BACKENDS)}")
+    return name
+
+def _resource_digest(doc: pymupdf.Document, xref: int, is_font: bool, memo: Dict[int, bytes]) -> bytes:
+    """
+    Digest of a Form XObject or font used by a page: its dictionary and the
+    streams that change the text drawn with it (the form's content, or the
+    font's ToUnicode map and embedded font file). Memoized per document.
+    """
+    if xref not in memo:
+        digest = hashlib.blake2b(doc.xref_object(xref, compressed=True).encode("utf-8"), digest_size=20)
+        if is_font:
+            kind, value = doc.xref_get_key(xref, "ToUnicode")
+            if kind == "xref":
+                digest.update(doc.xref_stream(int(value.split()[0])) or b"")
+            digest.update(doc.extract_font(xref)[-1] or b"")
+        else:
+            digest.update(doc.xref_stream(xref) or b"")
+        memo[xref] = digest.digest()
+    return memo[xref]
+
+def _page_hashes(source: PdfSource, page_numbers: Sequence[int]) -> Tuple[Dict[int, str], int]:
+    """
+    Hashes the given pages of a PDF without parsing their text: the raw content
+    stream and page size, plus the Form XObjects and fonts it draws with, which
+    also shape the extracted text. Returns the hashes by page number and the
+    total page count.
+    """
+    doc = pymupdf.open(stream=source, filetype="pdf") if isinstance(source, bytes) else pymupdf.open(source)
+    with doc:
+        page_count = doc.page_count
+        hashes: Dict[int, str] = {}
+        memo: Dict[int, bytes] = {}
+        for page_number in page_numbers:
+            if page_number >= page_count:
+                break
+            page = doc.load_page(page_number)
+            digest = hashlib.blake2b(page.read_contents(), digest_size=20)
+            digest.update(repr(tuple(page.rect)).encode("utf-8"))
+            # Fonts are listed with full=True so those used only inside Form XObjects are included.
+            for xref, is_font in sorted(
+                {(xobject[0], False) for xobject in page.get_xobjects()}
+                | {(font[0], True) for font in page.get_fonts(full=True)}
+            ):
+                if xref > 0:
+                    digest.update(_resource_digest(doc, xref, is_font, memo))
+            digest.update(repr([font[3:6] for font in page.get_fonts()]).encode("utf-8"))
+            hashes[page_number] = digest.hexdigest()
+    return hashes, page_count
+
+def _parse_pdf_pages(source: PdfSource, page_numbers: List[int], backend: str) -> Tuple[List[str], int]:
+    """
+    Parses pages (in ascending order) with `backend`, re-reading the pages it
+    returns empty with the fallback backend. Returns the texts and the page count.
+    """
+    texts, page_count = PDF_BACKENDS[backend](source, page_numbers)
+    empty = [i for i, text in enumerate(texts) if not text.strip()]
+    if empty and backend != PDF_FALLBACK_BACKEND:
+        fallback_texts, _ = PDF_BACKENDS[PDF_FALLBACK_BACKEND](source, [page_numbers[i] for i in empty])
+        for i, text in zip(empty, fallback_texts):
+            texts[i] = text
+    return texts, page_count
+
+# --- Internal helper functions for reading files ---
+
+def _read_pdf_pages(
+    source: PdfSource, start: int, end: int, max_pages: int, backend: str
+) -> Tuple[List[str], int]:
+    """
+    Reads the texts of pages [start, end) from a PDF.
+    Runs inside a worker process and also returns the total page count, so the
+    first task tells the caller how many more tasks to dispatch. Pages whose
+    content is in the page cache are not parsed again.
+    """
+    try:
+        cache = _get_page_cache()
+    except sqlite3.Error as e:
+        logger.warning("Page cache unavailable; parsing the pages", extra={"fields": {"error": str(e)}})
+        cache = None
+    if cache is None:
+        texts, page_count = _parse_pdf_pages(source, list(range(start, end)), backend)
+        if page_count > max_pages:
+            raise ValueError(f"PDF has {page_count} pages; the limit is {max_pages}.")
+        return texts, page_count
+
+    hashes, page_count = _page_hashes(source, range(start, end))
+    if page_count > max_pages:
+        raise ValueError(f"PDF has {page_count} pages; the limit is {max_pages}.")
+    page_numbers = list(hashes)
+    parser = f"{backend}+{PDF_FALLBACK_BACKEND}"
+    keys = {page_number: PageTextCache.make_key(hashes[page_number], parser) for page_number in page_numbers}
+    # The cache only saves work: if it fails (e.g. "database is locked"), pages are parsed instead.
+    try:
+        texts_by_page = cache.get_many(keys)
+    except sqlite3.Error as e:
+        logger.warning("Page cache lookup failed; parsing the pages", extra={"fields": {"error": str(e)}})
+        texts_by_page = {}
+    missing = [page_number for page_number in page_numbers if page_number not in texts_by_page]
+    if missing:
+        parsed = dict(zip(missing, _parse_pdf_pages(source, missing, backend)[0]))
+        try:
+            cache.set_many({keys[page_number]: text for page_number, text in parsed.items()})
+        except sqlite3.Error as e:
+            logger.warning("Page cache write failed", extra={"fields": {"error": str(e)}})
+        texts_by_page.update(parsed)
+    return [texts_by_page[page_number] for page_number in page_numbers], page_count
+
+async def _iter_pdf_pages_async(source: PdfSource, backend: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Yields the text of each page of a PDF in order, parsed in the PDF process pool.
+    Page ranges are parsed in parallel, but only PDF_PROCESS_WORKERS ranges are
+    scheduled ahead of the consumer, so memory stays bounded on huge files.
+    """
+    backend = _resolve_pdf_backend(backend)
+    size = len(source) if isinstance(source, bytes) else os.path.getsize(source)
+    if size > MAX_PDF_BYTES:
+        raise ValueError(f"PDF is {size} bytes; the limit is {MAX_PDF_BYTES}.")
+
+    loop = asyncio.get_running_loop()
+    executor = get_pdf_executor()
+
+    def submit(start: int) -> asyncio.Future:
+        return loop.run_in_executor(
+            executor, _read_pdf_pages, source, start, start + PDF_PAGES_PER_TASK, MAX_PDF_PAGES, backend
+        )
+
+    texts, page_count = await submit(0)
+    next_starts = iter(range(PDF_PAGES_PER_TASK, page_count, PDF_PAGES_PER_TASK))
+    pending: Deque[asyncio.Future] = deque(submit(start) for start in islice(next_starts, PDF_PROCESS_WORKERS))
+    try:
+        for text in texts:
+            yield text
+        while pending:
+            texts, _ = await pending.popleft()
+            pending.extend(submit(start) for start in islice(next_starts, 1))
+            for text in texts:
+                yield text
+    finally:
+        for future in pending:
+            future.cancel()
+
+async def _read_text_from_pdf_from_memory_async(file_bytes: bytes, backend: Optional[str] = None) -> str:
+    """Reads text from a PDF file's bytes in the PDF process pool."""
+    return "".join([text async for text in _iter_pdf_pages_async(file_bytes, backend)])
+
+async def _iter_text_from_text_file_async(path: str, extension: str) -> AsyncIterator[str]:
+    """Yields a UTF-8 text file in blocks, decoding incrementally."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with open(path, "rb") as f:
+        while True:
+            block = await asyncio.to_thread(f.read, TEXT_READ_BLOCK_SIZE)
+            try:
+                text = decoder.decode(block, final=not block)
+            except UnicodeDecodeError:
+                raise ValueError(f"Unsupported file extension: {extension}, and could not decode as plain text.")
+            if text:
+                yield text
+            if not block:
+                break
 
 def _read_text_from_md_from_memory(file_bytes: bytes) -> str:
     """Reads text from a Markdown file's bytes."""
     return file_bytes.decode("utf-8")
 
-async def _read_text_from_bib_from_memory_async(file_bytes: bytes) -> str:
-    """Parses BibTeX bytes, downloads the linked PDF asynchronously, and extracts its text."""
+async def _download_pdf_from_bib_async(file_bytes: bytes) -> bytes:
+    """Parses BibTeX bytes and downloads the linked PDF asynchronously."""
     bibtex_text = file_bytes.decode("utf-8")
     bib_db = bibtexparser.loads(bibtex_text)
     if not bib_db.entries:
@@ -32,28 +277,77 @@ async def _read_text_from_bib_from_memory_async(file_bytes: bytes) -> str:
     async with httpx.AsyncClient() as client:
         response = await client.get(url)
         response.raise_for_status()
-        pdf_bytes = response.content
+        return response.content
 
+async def _read_text_from_bib_from_memory_async(file_bytes: bytes, pdf_backend: Optional[str] = None) -> str:
+    """Parses BibTeX bytes, downloads the linked PDF asynchronously, and extracts its text."""
+    pdf_bytes = await _download_pdf_from_bib_async(file_bytes)
     # Reuse the in-memory PDF reader
-    return _read_text_from_pdf_from_memory(pdf_bytes)
+    return await _read_text_from_pdf_from_memory_async(pdf_bytes, pdf_backend)
 
-# --- Main dispatcher function ---
+# --- Main dispatcher functions ---
 
-async def read_file_from_memory_async(file_bytes: bytes, extension: str) -> str:
+async def iter_text_from_file_async(path: str, extension: str, pdf_backend: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Streaming counterpart of read_file_from_memory_async for a file on disk.
+    Yields the document text incrementally (page by page for PDFs, in blocks
+    for text files) so chunking and extraction can start before the whole
+    file has been parsed. The time spent waiting for text, not counting the
+    time the consumer holds each piece, is recorded per format.
+    """
+    extension = extension.lower()
+    texts = _iter_text_from_path_async(path, extension, pdf_backend)
+    waited = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                text = await anext(texts)
+            except StopAsyncIteration:
+                break
+            finally:
+                waited += time.perf_counter() - started
+            yield text
+    finally:
+        await texts.aclose()
+        TEXT_EXTRACTION_SECONDS.observe(waited, format=extension.lstrip(".") or "text")
+
+async def _iter_text_from_path_async(path: str, extension: str, pdf_backend: Optional[str]) -> AsyncIterator[str]:
+    if extension == ".pdf":
+        async for text in _iter_pdf_pages_async(path, pdf_backend):
+            yield text
+    elif extension == ".bib":
+        with open(path, "rb") as f:
+            file_bytes = await asyncio.to_thread(f.read)
+        pdf_bytes = await _download_pdf_from_bib_async(file_bytes)
+        async for text in _iter_pdf_pages_async(pdf_bytes, pdf_backend):
+            yield text
+    else:
+        # Markdown and plain text files
+        async for text in _iter_text_from_text_file_async(path, extension):
+            yield text
+
+async def read_file_from_memory_async(file_bytes: bytes, extension: str, pdf_backend: Optional[str] = None) -> str:
     """
     Dispatcher that reads file content from memory based on the file extension.
-    This function is async to handle the BibTeX case.
+    This function is async so PDF parsing (in a process pool) and the BibTeX
+    download never block the event loop. `pdf_backend` picks an engine from
+    PDF_BACKENDS for this call and defaults to the PDF_BACKEND setting.
     """
     extension = extension.lower()
+    with TEXT_EXTRACTION_SECONDS.time(format=extension.lstrip(".") or "text"):
+        return await _read_file_from_memory_async(file_bytes, extension, pdf_backend)
+
+async def _read_file_from_memory_async(file_bytes: bytes, extension: str, pdf_backend: Optional[str]) -> str:
     if extension == ".pdf":
-        return _read_text_from_pdf_from_memory(file_bytes)
+        return await _read_text_from_pdf_from_memory_async(file_bytes, pdf_backend)
     elif extension == ".md":
         return _read_text_from_md_from_memory(file_bytes)
     elif extension == ".bib":
-        return await _read_text_from_bib_from_memory_async(file_bytes)
+        return await _read_text_from_bib_from_memory_async(file_bytes, pdf_backend)
     else:
         # Fallback for plain text files
         try:
             return file_bytes.decode("utf-8")
         except UnicodeDecodeError:
-            raise ValueError(f"Unsupported file extension: {extension}, and could not decode as plain text.")
\ No newline at end of file
+            raise ValueError(f"Unsupported file extension: {extension}, and could not decode as plain text.")